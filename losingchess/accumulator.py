@@ -0,0 +1,133 @@
+import chess
+import vectorize
+
+import numpy as np
+from copy import copy
+
+"""
+Incremental evaluation of the first layer of a network, in the style of NNUE.
+
+When a network's input features each describe one piece, a move changes only a few of
+them, so the first layer's values before activation (x.W + b) can be kept up to date
+by adding and subtracting rows of W as moves are pushed, instead of multiplying the
+whole feature vector at every leaf. An Accumulator is attached to a LosingBoard, which
+tells it the pieces each move places and removes; it keeps one row of values for each
+move pushed since it was last refreshed, so pop usually only steps back a row.
+"""
+
+# rows the stack of values is first made for; it grows as deep as the board is pushed
+INITIAL_DEPTH = 64
+
+def piece_count_feature(color, ptype, square):
+    return (0 if color == chess.WHITE else 6) + ptype - 1
+
+def piece_square_feature(color, ptype, square):
+    return vectorize.piece_square_index(color, ptype, square)
+
+# for each vectorization that can be updated incrementally, the feature of a piece and
+# the index of the turn feature, if any
+features = {vectorize.piece_count_vector: (piece_count_feature, None),
+            vectorize.piece_square_vector: (piece_square_feature, vectorize.PIECE_SQUARE_TURN)}
+
+def incremental(vectorize_method):
+    return vectorize_method in features
+
+class Accumulator:
+    """
+    x.W + b for the position of a LosingBoard, where x is vectorize_method of the
+    board. The values are only computed from scratch when the accumulator is first
+    used or finds the board changed behind its back; rounding errors from the updates
+    in between stay within float32 precision of the exact values.
+    """
+    def __init__(self, W, b, vectorize_method):
+        if not incremental(vectorize_method):
+            raise Exception('Cannot update ' + vectorize_method.__name__ + ' incrementally.')
+        self.W = np.ascontiguousarray(W, dtype=np.float32)
+        self.b = np.ascontiguousarray(b, dtype=np.float32).reshape(-1)
+        self.vectorize_method = vectorize_method
+        self.feature, self.turn_feature = features[vectorize_method]
+
+        # values and position key for each move pushed since the last refresh
+        self.rows = np.empty((INITIAL_DEPTH, self.W.shape[1]), dtype=np.float32)
+        self.keys = [None] * INITIAL_DEPTH
+        self.depth = 0
+        self.stale = True
+
+    def __deepcopy__(self, memo):
+        # copies of a board share the weights
+        other = copy(self)
+        other.rows = self.rows.copy()
+        other.keys = list(self.keys)
+        return other
+
+    def refresh(self, board):
+        """
+        Compute the values for board from scratch.
+        """
+        x = np.asarray(self.vectorize_method(board), dtype=np.float32)
+        np.dot(x, self.W, out=self.rows[0])
+        self.rows[0] += self.b
+        self.keys[0] = board.zobrist_hash
+        self.depth = 0
+        self.stale = False
+
+    def push(self, changes, mover, key):
+        """
+        Update the values for a move by mover, given the (color, piece type, square,
+        +1 or -1) of each piece placed or removed and the key of the new position.
+        """
+        if self.stale:
+            return
+        if self.depth + 1 == len(self.rows):
+            self.rows = np.concatenate([self.rows, np.empty_like(self.rows)])
+            self.keys += [None] * len(self.keys)
+
+        row = self.rows[self.depth + 1]
+        row[:] = self.rows[self.depth]
+        self.apply(row, changes, mover, 1)
+        self.depth += 1
+        self.keys[self.depth] = key
+
+    def pop(self, changes, mover, key):
+        """
+        Step back over a move by mover, given the changes it made and the key of the
+        position before it. Popping past the position of the last refresh undoes the
+        changes in place.
+        """
+        if self.stale:
+            return
+        if self.depth > 0:
+            self.depth -= 1
+        else:
+            self.apply(self.rows[0], changes, mover, -1)
+            self.keys[0] = key
+
+    def apply(self, row, changes, mover, direction):
+        """
+        Add the changes of a move to row, or take them away if direction is -1.
+        """
+        # sum the changes per feature first, so that a piece moving within one feature
+        # leaves the values untouched
+        deltas = {}
+        for color, ptype, square, sign in changes:
+            feature = self.feature(color, ptype, square)
+            deltas[feature] = deltas.get(feature, 0) + sign * direction
+        if self.turn_feature is not None:
+            deltas[self.turn_feature] = (-1 if mover == chess.WHITE else 1) * direction
+
+        for feature, delta in deltas.items():
+            if delta == 1:
+                row += self.W[feature]
+            elif delta == -1:
+                row -= self.W[feature]
+            elif delta:
+                row += delta * self.W[feature]
+
+    def values(self, board):
+        """
+        The values for board, which must be the board the accumulator is attached to.
+        The array returned is overwritten by later pushes.
+        """
+        if self.stale or self.keys[self.depth] != board.zobrist_hash:
+            self.refresh(board)
+        return self.rows[self.depth]
@@ -1,29 +1,93 @@
 import chess
 import losing_board
+import move_ordering
+import transposition
+import worker_pool
+import math
 import random
 import time
-import copy_reg
-import types
-from functools import partial
-from multiprocessing import Pool
+
+# deepest iteration tried by a search running on a time or node budget
+MAX_ITERATIVE_DEPTH = 32
+
+# value of a won game, and a bound above every value
+WIN_VALUE = 99999
+INFINITY = 100000
+
+# width of the null windows used to test whether a move beats the best so far
+NULL_WINDOW = 1e-6
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its time or node budget runs out.
+    """
+    pass
+
+class SearchAborted(Exception):
+    """
+    Raised inside a parallel worker's search when another process has raised the
+    shared bound past the window it is searching with.
+    """
+    pass
 
 class Agent:
     """
     Parent class for all agents. Agents must be able to return a move
     given a game_state
+
+    time_limit (seconds) and node_limit set a per-move budget for agents that
+    search by iterative deepening; other agents ignore them.
     """
-    def __init__(self, eval_func, ant_eval_func, color=chess.WHITE, depth=1, parallelize=False):
+    def __init__(self, eval_func, ant_eval_func, color=chess.WHITE, depth=1, parallelize=False,
+                 time_limit=None, node_limit=None):
         self.color = color
         self.eval_func = eval_func
         self.depth = depth - 1
         self.ant_eval_func = ant_eval_func
         self.parallelize = parallelize
+        self.time_limit = time_limit
+        self.node_limit = node_limit
         if self.depth < 0:
             raise Exception("Depth must be >= 0")
 
     def get_move(self, game_state):
         raise Exception("Undefined!")
 
+    def evaluate_moves(self, board, moves, color, eval_func=None):
+        """
+        Return eval_func (by default self.eval_func) for color of the position reached
+        by each of moves on board. If the evaluator scores feature vectors (see
+        evaluation.BatchEvaluator), each position is vectorized as it is visited and
+        all are scored in one batched call.
+        """
+        eval_func = eval_func or self.eval_func
+        evaluator = getattr(eval_func, 'im_self', None)
+        batched = hasattr(evaluator, 'evaluate_vectors')
+
+        values = []
+        for mv in moves:
+            board.push(mv)
+            try:
+                values.append(evaluator.vectorize(board, color) if batched else eval_func(board, color))
+            finally:
+                board.pop()
+
+        if batched and values:
+            return list(evaluator.evaluate_vectors(values, color))
+        return values
+
+    def batches_evaluation(self, eval_func=None):
+        """
+        Whether eval_func (by default self.eval_func) is scored in batches.
+        """
+        return hasattr(getattr(eval_func or self.eval_func, 'im_self', None), 'evaluate_vectors')
+
+    def close(self):
+        """
+        Release any processes the agent holds; called when a game ends.
+        """
+        pass
+
 class HumanAgent(Agent):
     """
     The agent that takes a move from std in
@@ -62,22 +126,6 @@ class RandomAgent(Agent):
             move = random.sample(moves, 1)[0]
             return move
 
-"""
-Necessary code for running a class method in parallel.
-Essentially, tells python how to convert a method that is built into a class 
-to a standalone binary file (since this is necessary for multiprocesing).
-
-citation: dano, http://stackoverflow.com/questions/25156768
-          /cant-pickle-type-instancemethod-using-pythons-multiprocessing-pool-apply-a
-"""
-def _pickle_method(m):
-    if m.im_self is None:
-        return getattr, (m.im_class, m.im_func.func_name)
-    else:
-        return getattr, (m.im_self, m.im_func.func_name)
-
-copy_reg.pickle(types.MethodType, _pickle_method)
-
 class MinimaxAgent(Agent):
     """
     Agent that returns the minimax optimal move according to the evaluation function
@@ -112,9 +160,17 @@ class MinimaxAgent(Agent):
         """
         Helper function for performing expectimax.
         """
-        # get next game state
-        next_state = board.generate_successor(move)
-
+        # make the move on the shared board, and undo it once the subtree is valued
+        board.push(move)
+        try:
+            return self._state_value(board, depth, color)
+        finally:
+            board.pop()
+
+    def _state_value(self, next_state, depth, color):
+        """
+        Value of next_state, which has just been reached by a move of color.
+        """
         # has agent won?
         if next_state.is_game_over():
             return 99999
@@ -166,119 +222,542 @@ class MinimaxAgent(Agent):
 class AlphaBetaAgent(Agent):
     """
     Agent that returns the minimax move using alpha-beta pruning
+
+    The search is negamax with principal variation search: the first move at each
+    node is searched with the full window, and the rest with a null window that only
+    tests whether they beat it, re-searching those that do. Values are from the point
+    of view of the side to move. A depth of d searches 2d - 1 plies, ending after a
+    move of this agent.
+
+    With parallelize, parallel_mode picks how root moves are split across processes:
+    -> 'ybwc' (young brothers wait): the first move is searched serially, then its
+       siblings are searched by workers that share the best value found so far.
+    -> 'root': the siblings are searched independently with a null window at the
+       first move's value.
+    -> 'lazy_smp': helper processes search the same position as this one, at
+       staggered depths and in random move orders, until this search finishes. The
+       processes share only the transposition table, which lives in shared memory.
+    A time or node limit can only be used serially or with 'lazy_smp'; the 'ybwc' and
+    'root' searches go to a fixed depth.
     """
+    def __init__(self, eval_func, ant_eval_func, color=chess.WHITE, depth=1, parallelize=False,
+                 time_limit=None, node_limit=None, tt_size_mb=16, order_moves=True, aspiration_window=None,
+                 quiescence=False, quiescence_node_limit=1000, parallel_mode='ybwc', batch_leaves=None):
+        Agent.__init__(self, eval_func, ant_eval_func, color=color, depth=depth, parallelize=parallelize,
+                       time_limit=time_limit, node_limit=node_limit)
+        if parallel_mode not in ('ybwc', 'root', 'lazy_smp'):
+            raise Exception("Unknown parallel mode: " + str(parallel_mode))
+        self.parallel_mode = parallel_mode
+
+        # transposition table of searched positions, kept for the whole game
+        if parallelize and parallel_mode == 'lazy_smp':
+            if not tt_size_mb:
+                raise Exception("Lazy SMP needs a transposition table")
+            self.tt = transposition.SharedTranspositionTable(tt_size_mb)
+        elif tt_size_mb:
+            self.tt = transposition.TranspositionTable(tt_size_mb)
+        else:
+            self.tt = None
+
+        # hash move, killer, capture and history ordering; history is kept for the whole game
+        self.orderer = move_ordering.MoveOrderer() if order_moves else None
+
+        # half-width of the window around the previous iteration's value when deepening
+        self.aspiration_window = aspiration_window
+
+        # play out forced capture chains at the leaves, up to a node limit per leaf
+        self.quiescence = quiescence
+        self.quiescence_node_limit = quiescence_node_limit
+        self.qnodes = 0
+        self.leaf_qnodes = 0
+
+        # evaluate the children of frontier nodes in one batch; by default, when the
+        # evaluator supports it
+        self.batch_leaves = self.batches_evaluation() if batch_leaves is None else batch_leaves
+
+        # leaves are evaluated against the search window if the evaluator can use it
+        self.evaluate_bounded = getattr(getattr(eval_func, 'im_self', None), 'evaluate_bounded', None)
+
+        # worker processes for the parallel root search, started on first use
+        self.pool = None
+
+        # in a worker: the best root value shared by all processes, and the alpha the
+        # current task is searching with (its search is moot once the shared value passes it)
+        self.shared_alpha = None
+        self.search_alpha = None
+
+        # in a lazy SMP helper: shared flag set when the main search is done
+        self.stop_flag = None
+
+        # search budget of the current move, checked in _negamax
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+
     def get_move(self, game_state, return_value=False):
         """
         Return minimax move using self.depth, self.eval_func, and alpha-beta pruning.
+        With a time or node limit, deepen iteratively instead of searching to self.depth.
         """
-        moves = game_state.board.get_legal_moves()
+        budgeted = self.time_limit is not None or self.node_limit is not None
+        if budgeted and self.parallelize and self.parallel_mode in ('ybwc', 'root'):
+            raise Exception("A time or node limit needs a serial or lazy_smp search, not " + self.parallel_mode)
+
+        board = game_state.board
+        moves = board.get_legal_moves()
         if len(moves) == 0:
             return None
 
-        if self.parallelize:
-            get_ab_value = partial( self._alpha_beta_value, board=game_state.board,
-                                    alpha=-99999, beta=99999, depth=0,
-                                    color=self.color)
-
-            p = Pool(8)
-            values = p.map_async(get_ab_value, moves).get(99999)
-            p.terminate()
-
-            values = {mv: v for mv, v in zip(moves, values)}
-
-        else:
-            values = {}
-            for move in moves:
-                values[move] = self._alpha_beta_value(move, game_state.board, alpha=-99999, beta=99999, 
-                                                      depth=0, color=self.color)
+        if self.orderer is not None:
+            self.orderer.new_search()
+        self.qnodes = 0
+
+        # random order among moves the ordering cannot tell apart, so that equally
+        # good moves are picked at random
+        random.shuffle(moves)
+        if self.orderer is not None:
+            entry = self.tt.probe(board.zobrist_hash) if self.tt is not None else None
+            moves = self.orderer.order(board, moves, 0, entry[3] if entry is not None else None)
+
+        lazy_smp = self.parallelize and self.parallel_mode == 'lazy_smp'
+        if lazy_smp:
+            self._worker_pool().start_helpers(board)
+        try:
+            if budgeted:
+                best_action, best_val = self._iterative_deepening(board, moves)
+            elif self.parallelize and self.parallel_mode == 'ybwc':
+                best_action, best_val = self._ybwc_search_root(board, moves, 2 * self.depth + 1)
+            elif self.parallelize and self.parallel_mode == 'root':
+                best_action, best_val = self._parallel_search_root(board, moves, 2 * self.depth + 1)
+            else:
+                self.nodes = 0
+                best_action, best_val = self._search_root(board, moves, 2 * self.depth + 1)
+        finally:
+            if lazy_smp:
+                self.pool.stop_helpers()
 
-        # return action with max utility,
-        # random action if there's a tie
-        best_val = max(values.values())
-        best_actions = []
-        for k, v in values.iteritems():
-            if v == best_val:
-                best_actions.append(k)
-        best_action = random.sample(best_actions, 1)[0]
         if return_value:
             return (best_action, best_val)
         else:
             return best_action
 
-
-    def _alpha_beta_value(self, move, board, alpha, beta, depth, color):
+    def _iterative_deepening(self, board, moves):
+        """
+        Search to depth 1, 2, 3, ... until the time or node budget runs out, and return
+        the (move, value) of the last completed iteration. Each iteration searches the
+        previous best move first, and with an aspiration window, within
+        aspiration_window of the previous value.
+        """
+        start = time.time()
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+
+        root_moves = list(moves)
+        best_action, best_val = None, None
+        try:
+            for depth in range(MAX_ITERATIVE_DEPTH):
+                plies = 2 * depth + 1
+                if self.aspiration_window is not None and best_val is not None and abs(best_val) < WIN_VALUE:
+                    alpha = best_val - self.aspiration_window
+                    beta = best_val + self.aspiration_window
+                    action, value = self._search_root(board, root_moves, plies, alpha, beta)
+                    # the true value lies outside the window, so search again with a full one
+                    if value <= alpha or value >= beta:
+                        action, value = self._search_root(board, root_moves, plies)
+                else:
+                    action, value = self._search_root(board, root_moves, plies)
+                best_action, best_val = action, value
+
+                root_moves.remove(best_action)
+                root_moves.insert(0, best_action)
+
+                # the first iteration always completes, so there is a move to return
+                if depth == 0:
+                    if self.time_limit is not None:
+                        self.deadline = start + self.time_limit
+                    if self.node_limit is not None:
+                        self.max_nodes = self.node_limit
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+            self.max_nodes = None
+
+        return best_action, best_val
+
+    def _search_root(self, board, moves, plies, alpha=-INFINITY, beta=INFINITY):
+        """
+        Principal variation search of the root moves, in the given order, to plies.
+        Return the best (move, value) for the side to move.
         """
-        Helper function for performing alpha-beta pruning.
+        best_action, best_val = None, -INFINITY
+        for i, move in enumerate(moves):
+            if i == 0:
+                v = self._search_root_move(move, board, alpha, beta, plies)
+            else:
+                v = self._search_root_move(move, board, alpha, alpha + NULL_WINDOW, plies)
+                if alpha < v < beta:
+                    v = self._search_root_move(move, board, alpha, beta, plies)
+
+            if v > best_val:
+                best_action, best_val = move, v
+            if v > alpha:
+                alpha = v
+            if alpha >= beta:
+                break
+
+        return best_action, best_val
+
+    def _parallel_search_root(self, board, moves, plies):
         """
-        # get next game state
-        next_state = board.generate_successor(move)
+        Search the first root move, then the rest in parallel with a null window at its
+        value. Moves that beat it are searched again with the full window.
+        """
+        self.nodes = 0
+        first_val = self._search_root_move(moves[0], board, -INFINITY, INFINITY, plies)
+        best_action, best_val = moves[0], first_val
+        alpha = first_val
+
+        if len(moves) > 1:
+            values = [None] * (len(moves) - 1)
+            for i, v in self._worker_pool().search(board, moves[1:], first_val, first_val + NULL_WINDOW, plies):
+                values[i] = v
+
+            for move, v in zip(moves[1:], values):
+                if v > first_val:
+                    v = self._search_root_move(move, board, alpha, INFINITY, plies)
+                    if v > best_val:
+                        best_action, best_val = move, v
+                        alpha = v
+
+        return best_action, best_val
+
+    def _ybwc_search_root(self, board, moves, plies):
+        """
+        Search the first root move (the eldest brother) serially, then its siblings in
+        parallel. Workers share the best value found so far as their alpha, and abort
+        and restart a search when another worker raises it.
+        """
+        self.nodes = 0
+        first_val = self._search_root_move(moves[0], board, -INFINITY, INFINITY, plies)
+        best_action, best_val = moves[0], first_val
 
-        # has agent won?
-        if next_state.is_game_over():
-            return 99999
+        # a won position leaves nothing for the siblings to improve on
+        if len(moves) > 1 and first_val < WIN_VALUE:
+            for i, v, exact in self._worker_pool().search_shared(board, moves[1:], first_val, plies):
+                if exact and v > best_val:
+                    best_action, best_val = moves[i + 1], v
 
-        # does agent move next?
-        next_color = not color
+        return best_action, best_val
 
-        # has max depth been reached?
-        if depth == self.depth:
-            return self.eval_func(next_state, color)
+    def _shared_search_root_move(self, move, board, plies):
+        """
+        Worker side of the ybwc search. Test move with a null window at the shared
+        alpha and search it fully if it beats it, restarting whenever the shared alpha
+        rises. Return (value, exact): an exact value beat the shared alpha and has been
+        published; otherwise value is only an upper bound, or None if the root is won.
+        """
+        shared = self.shared_alpha
+        while True:
+            alpha = shared.value
+            if alpha >= WIN_VALUE:
+                return None, False
+
+            self.search_alpha = alpha
+            try:
+                v = self._search_root_move(move, board, alpha, alpha + NULL_WINDOW, plies)
+                if v > alpha:
+                    v = self._search_root_move(move, board, alpha, INFINITY, plies)
+            except SearchAborted:
+                continue
+            finally:
+                self.search_alpha = None
+
+            if v <= alpha:
+                return v, False
+            with shared.get_lock():
+                if v > shared.value:
+                    shared.value = v
+            return v, True
+
+    def _helper_search(self, board, helper):
+        """
+        Lazy SMP helper: deepen iteratively on board until the stop flag is set. Odd
+        helpers start a depth ahead, and each iteration shuffles the root moves. Results
+        reach the main search only through the shared transposition table.
+        Return the number of nodes searched.
+        """
+        self.nodes = 0
+        moves = board.get_legal_moves()
+        try:
+            for depth in range(helper % 2, MAX_ITERATIVE_DEPTH):
+                random.shuffle(moves)
+                self._search_root(board, moves, 2 * depth + 1)
+        except SearchAborted:
+            pass
+        return self.nodes
+
+    def _worker_pool(self):
+        if self.pool is None:
+            self.pool = worker_pool.WorkerPool(self)
+        return self.pool
+
+    def close(self):
+        """
+        Shut down the worker pool, if one was started.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
 
-        # get information about next state
-        next_moves = next_state.get_legal_moves()
+    def _search_root_move(self, move, board, alpha, beta, plies):
+        """
+        Value of root move for the agent, within the (alpha, beta) window.
+        """
+        board.push(move)
+        try:
+            return -self._negamax(board, -beta, -alpha, plies - 1, 1)
+        finally:
+            board.pop()
 
-        # if this agent is to move
-        if next_color == self.color:
+    def _evaluate(self, board, alpha=-INFINITY, beta=INFINITY):
+        """
+        Evaluation of a leaf from the point of view of the side to move. An evaluator
+        with an evaluate_bounded method (see evaluation.LazyCascadeEval) is told the
+        (alpha, beta) window, and may return a bound outside it instead.
+        """
+        if self.evaluate_bounded is not None:
+            if board.board.turn == self.color:
+                return self.evaluate_bounded(board, self.color, alpha, beta)
+            return -self.evaluate_bounded(board, self.color, -beta, -alpha)
 
-            # increment depth
-            depth += 1
+        value = self.eval_func(board, self.color)
+        if board.board.turn == self.color:
+            return value
+        return -value
 
-            # if we've reached a terminal state
-            # update alpha and return terminal value
-            if next_moves == []:
-                term_val = self.eval_func(next_state, next_color)
-                alpha = max(alpha, term_val)
-                return term_val
+    def _terminal_value(self, board):
+        """
+        Value of a finished game for the side to move: the first player to lose all
+        pieces wins, and a player without moves wins if they have fewer pieces.
+        """
+        own = board.piece_totals[board.board.turn]
+        other = board.piece_totals[not board.board.turn]
+        if own < other:
+            return WIN_VALUE
+        elif own > other:
+            return -WIN_VALUE
+        return 0
+
+    def _poll(self):
+        """
+        Checks made every 256 nodes: the time budget, and in a worker, whether another
+        process has made its search moot.
+        """
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchTimeout()
+        if self.search_alpha is not None and self.shared_alpha.value > self.search_alpha:
+            raise SearchAborted()
+        if self.stop_flag is not None and self.stop_flag.value:
+            raise SearchAborted()
+
+    def _negamax(self, board, alpha, beta, plies, ply):
+        """
+        Value of board for the side to move, searching plies further, within the
+        (alpha, beta) window. ply is the distance from the root.
+        """
+        # stop the search once its budget is spent
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout()
+        if self.nodes & 255 == 0:
+            self._poll()
 
-            # find next action with max utility
-            v = -99999
-            for mv in next_moves:
-                mvValue = self._alpha_beta_value(mv, next_state, alpha, beta, depth, next_color)
-                v = max(v, mvValue)
-                # prune if value is great enough
-                if v >= beta:
-                    return v
-            alpha = max(alpha, v)
-            return v
+        # has somebody won?
+        if board.is_game_over():
+            return self._terminal_value(board)
 
-        # if opponent is to move
-        else:
-            # if we've reached a terminal state
-            # return terminal value without updating alpha/beta
-            if next_moves == []:
-                term_val = self.ant_eval_func(next_state, next_color)
-                return term_val
+        # has max depth been reached?
+        if plies <= 0:
+            if self.quiescence:
+                self.leaf_qnodes = 0
+                return self._quiescence(board, alpha, beta, ply)
+            return self._evaluate(board, alpha, beta)
+
+        # reuse the result of an earlier search of this position if it is deep enough
+        # and its bound decides the value within the (alpha, beta) window
+        hash_move = None
+        if self.tt is not None:
+            key = board.zobrist_hash
+            entry = self.tt.probe(key)
+            if entry is not None:
+                hash_move = entry[3]
+                if entry[0] >= plies:
+                    tt_flag, tt_value = entry[1], entry[2]
+                    if tt_flag == transposition.EXACT or \
+                            (tt_flag == transposition.LOWER and tt_value >= beta) or \
+                            (tt_flag == transposition.UPPER and tt_value <= alpha):
+                        return tt_value
+
+        moves = board.get_legal_moves()
+        if not moves:
+            return self._terminal_value(board)
+        if self.orderer is not None and len(moves) > 1:
+            moves = self.orderer.order(board, moves, ply, hash_move)
+
+        # the children of a frontier node are leaves: value them all at once
+        leaf_values = None
+        if plies == 1 and self.batch_leaves and not self.quiescence:
+            leaf_values = self._leaf_values(board, moves)
+
+        orig_alpha = alpha
+        best_move, best_val = None, -INFINITY
+        for i, mv in enumerate(moves):
+            if leaf_values is not None:
+                v = -leaf_values[i]
+            else:
+                board.push(mv)
+                try:
+                    if i == 0:
+                        v = -self._negamax(board, -beta, -alpha, plies - 1, ply + 1)
+                    else:
+                        v = -self._negamax(board, -alpha - NULL_WINDOW, -alpha, plies - 1, ply + 1)
+                        if alpha < v < beta:
+                            v = -self._negamax(board, -beta, -alpha, plies - 1, ply + 1)
+                finally:
+                    board.pop()
+
+            if v > best_val:
+                best_move, best_val = mv, v
+            if v > alpha:
+                alpha = v
+            # prune if value is great enough
+            if alpha >= beta:
+                if self.orderer is not None:
+                    self.orderer.record_cutoff(board, mv, ply, plies, i)
+                break
+
+        if self.tt is not None:
+            if best_val <= orig_alpha:
+                flag = transposition.UPPER
+            elif best_val >= beta:
+                flag = transposition.LOWER
+            else:
+                flag = transposition.EXACT
+            self.tt.store(key, plies, flag, best_val, best_move)
+
+        return best_val
+
+    def _leaf_values(self, board, moves):
+        """
+        Values of the positions after each of moves, for their side to move, as
+        _negamax would find them with no plies left, with the evaluations batched.
+        """
+        self.nodes += len(moves)
+        values = [None] * len(moves)
+        to_evaluate = []
+        for i, mv in enumerate(moves):
+            board.push(mv)
+            try:
+                if board.is_game_over():
+                    values[i] = self._terminal_value(board)
+                else:
+                    to_evaluate.append(i)
+            finally:
+                board.pop()
+
+        # the children have the opponent of board's side to move to move
+        sign = 1 if board.board.turn != self.color else -1
+        evaluations = self.evaluate_moves(board, [moves[i] for i in to_evaluate], self.color)
+        for i, value in zip(to_evaluate, evaluations):
+            values[i] = sign * value
+        return values
+
+    def _quiescence(self, board, alpha, beta, ply):
+        """
+        Value of a leaf for the side to move, within the (alpha, beta) window, after
+        playing out the forced capture chain that starts there.
 
-            # find next action with min utility
-            v = 99999
-            for mv in next_moves:
-                mvValue = self._alpha_beta_value(mv, next_state, alpha, beta, depth, next_color)
-                v = min(v, mvValue)
-                #prune if value is small enough
-                if v <= alpha:
-                    return v
-                beta = min(beta, v)
-            return v
+        The evaluator's stand-pat score is the value of a quiet leaf. Captures are
+        compulsory, so a side that must capture cannot stand pat; the stand-pat score
+        is also returned if the leaf's quiescence node limit runs out.
+        """
+        self.nodes += 1
+        self.qnodes += 1
+        self.leaf_qnodes += 1
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout()
+        if self.nodes & 255 == 0:
+            self._poll()
+
+        if board.is_game_over():
+            return self._terminal_value(board)
+
+        if self.leaf_qnodes >= self.quiescence_node_limit or not board.has_capture():
+            return self._evaluate(board, alpha, beta)
+
+        moves = board.generate_captures()
+        if self.orderer is not None and len(moves) > 1:
+            moves = self.orderer.order(board, moves, ply)
+
+        best_val = -INFINITY
+        for mv in moves:
+            board.push(mv)
+            try:
+                v = -self._quiescence(board, -beta, -alpha, ply + 1)
+            finally:
+                board.pop()
+
+            if v > best_val:
+                best_val = v
+            if v > alpha:
+                alpha = v
+            if alpha >= beta:
+                break
+
+        return best_val
 
 class ExpectimaxAgent(Agent):
     """
     Returns the expectimax value according to the evaluation function 
+
+    The opponent is modelled as picking uniformly among its moves, or with
+    model_opponent, with probabilities from a softmax of ant_eval_func over its moves.
+
+    If the evaluator declares a value range (Evaluator.value_range, or the value_range
+    argument), chance nodes are pruned with Star2: the opponent's replies are first
+    probed by searching one move of each, and the search of a chance node stops once
+    the bounds show its value lies outside the window. A won game is then worth the top
+    of the range and a lost one the bottom.
     """
+    def __init__(self, eval_func, ant_eval_func, color=chess.WHITE, depth=1, parallelize=False,
+                 time_limit=None, node_limit=None, prune=True, value_range=None, model_opponent=False,
+                 opponent_temperature=1.0):
+        Agent.__init__(self, eval_func, ant_eval_func, color=color, depth=depth, parallelize=parallelize,
+                       time_limit=time_limit, node_limit=node_limit)
+        if value_range is None and prune:
+            evaluator = getattr(eval_func, 'im_self', None)
+            if evaluator is not None and hasattr(evaluator, 'value_range'):
+                value_range = evaluator.value_range()
+        self.value_range = value_range if prune else None
+        self.model_opponent = model_opponent
+        self.opponent_temperature = opponent_temperature
+
+        # nodes visited and chance nodes cut off in the last search
+        self.nodes = 0
+        self.chance_cutoffs = 0
+
     def get_move(self, game_state, return_value=False):
         moves = game_state.board.get_legal_moves()
         if len(moves) == 0:
             return None
 
+        self.nodes = 0
+        self.chance_cutoffs = 0
+        if self.value_range is not None:
+            return self._pruned_move(game_state.board, moves, return_value)
+
         values = {}
         for move in moves:
             values[move] = self.get_value(move, game_state.board, 0, self.color)
@@ -300,9 +779,17 @@ class ExpectimaxAgent(Agent):
         """
         Helper function for performing expectimax.
         """
-        # get next game state
-        next_state = board.generate_successor(move)
-
+        # make the move on the shared board, and undo it once the subtree is valued
+        board.push(move)
+        try:
+            return self._state_value(board, depth, color)
+        finally:
+            board.pop()
+
+    def _state_value(self, next_state, depth, color):
+        """
+        Value of next_state, which has just been reached by a move of color.
+        """
         # has agent won?
         if next_state.is_game_over():
             return 99999
@@ -345,10 +832,178 @@ class ExpectimaxAgent(Agent):
                 return term_val
 
             # find next expected utility of next action
-            # p is the uniform probability of this action
-            p = 1.0 / float(len(next_moves))
+            # p is the probability of this action
             v = 0
-            for mv in next_moves:
+            for mv, p in self._opponent_model(next_state, next_moves):
                 mvValue = self.get_value(mv, next_state, depth, next_color)
                 v += p * mvValue
             return v
+
+    def _opponent_model(self, board, moves):
+        """
+        (move, probability) pairs for the opponent's moves on board, most likely first.
+        """
+        if not self.model_opponent or self.ant_eval_func is None:
+            p = 1.0 / float(len(moves))
+            return [(mv, p) for mv in moves]
+
+        opponent = board.board.turn
+        values = [v / self.opponent_temperature
+                  for v in self.evaluate_moves(board, moves, opponent, self.ant_eval_func)]
+        top = max(values)
+        weights = [math.exp(v - top) for v in values]
+        total = sum(weights)
+        return sorted([(mv, w / total) for mv, w in zip(moves, weights)], key=lambda pair: -pair[1])
+
+    def _pruned_move(self, board, moves, return_value):
+        """
+        Best move and its value by the pruned search. Moves are searched in random
+        order and only a strictly better one replaces the best, so ties go at random.
+        """
+        low, high = self.value_range
+        moves = list(moves)
+        random.shuffle(moves)
+
+        best_action, best_val = None, None
+        for move in moves:
+            alpha = low if best_val is None else best_val
+            board.push(move)
+            try:
+                v = self._after_agent(board, 0, alpha, high)
+            finally:
+                board.pop()
+            if best_val is None or v > best_val:
+                best_action, best_val = move, v
+
+        if return_value:
+            return (best_action, best_val)
+        return best_action
+
+    def _terminal(self, board):
+        """
+        Value of a finished game at the bounds of the value range, or of a draw by the
+        evaluator.
+        """
+        winner = board.winner_by_pieces()
+        if winner == 0.5:
+            return self._leaf(board)
+        return self.value_range[1] if winner == self.color else self.value_range[0]
+
+    def _leaf(self, board):
+        low, high = self.value_range
+        return min(max(self.eval_func(board, self.color), low), high)
+
+    def _after_agent(self, board, depth, alpha, beta):
+        """
+        Value of board, just reached by a move of the agent, within (alpha, beta).
+        Fail-soft: a value at or below alpha is an upper bound, and one at or above beta
+        a lower bound.
+        """
+        self.nodes += 1
+        if board.is_game_over():
+            return self._terminal(board)
+        if depth == self.depth:
+            return self._leaf(board)
+
+        moves = board.get_legal_moves()
+        if not moves:
+            return self._terminal(board)
+        return self._chance(board, self._opponent_model(board, moves), depth, alpha, beta)
+
+    def _after_opponent(self, board, depth, alpha, beta, probe=False, first_value=None):
+        """
+        Value of board, just reached by a move of the opponent, within (alpha, beta).
+        With probe, only the first of the agent's moves is searched, which gives a
+        lower bound. first_value is the exact value of the first move, if a probe has
+        already found it.
+        """
+        self.nodes += 1
+        if board.is_game_over():
+            return self._terminal(board)
+
+        moves = board.get_legal_moves()
+        if not moves:
+            return self._terminal(board)
+        if probe:
+            moves = moves[:1]
+
+        v = self.value_range[0]
+        if first_value is not None:
+            v = first_value
+            moves = moves[1:]
+            if v >= beta:
+                return v
+        for mv in moves:
+            board.push(mv)
+            try:
+                v = max(v, self._after_agent(board, depth + 1, max(alpha, v), beta))
+            finally:
+                board.pop()
+            if v >= beta:
+                break
+        return v
+
+    def _chance(self, board, outcomes, depth, alpha, beta):
+        """
+        Star2 search of the opponent's (move, probability) outcomes on board.
+        """
+        low, high = self.value_range
+
+        # outcomes whose probability underflowed to zero add nothing to the value, and
+        # would divide the windows below by zero
+        outcomes = [(mv, p) for mv, p in outcomes if p > 0.0]
+
+        # probing pass: lower bounds from one agent reply to each opponent move,
+        # cutting off as soon as they alone reach beta
+        lower = []
+        for i, (mv, p) in enumerate(outcomes):
+            rest = sum(q for m, q in outcomes[i + 1:])
+            probe_beta = (beta - sum(p_j * l_j for (m, p_j), l_j in zip(outcomes, lower)) - low * rest) / p
+            board.push(mv)
+            try:
+                lb = self._after_opponent(board, depth, low, min(probe_beta, high), probe=True)
+            finally:
+                board.pop()
+            lower.append(lb)
+            # below probe_beta the probed value is exact, and is reused in the Star1 pass
+            if lb >= probe_beta:
+                self.chance_cutoffs += 1
+                return sum(p_j * l_j for (m, p_j), l_j in zip(outcomes, lower)) + low * rest
+
+        # Star1 pass: search each outcome in a window narrowed by the exact values of
+        # those searched, the probed lower bounds and the top of the range for the rest.
+        # Outcomes probed worst for the agent go first, so a fail low shows up early.
+        order = sorted(range(len(outcomes)), key=lambda k: lower[k])
+        outcomes = [outcomes[k] for k in order]
+        lower = [lower[k] for k in order]
+        done = 0.0
+        for i, (mv, p) in enumerate(outcomes):
+            rest = sum(q for m, q in outcomes[i + 1:])
+            rest_lower = sum(p_j * l_j for (m, p_j), l_j in zip(outcomes[i + 1:], lower[i + 1:]))
+            child_alpha = (alpha - done - high * rest) / p
+            child_beta = (beta - done - rest_lower) / p
+
+            # the window lies outside the range, so the bounds alone decide
+            if child_alpha >= high:
+                self.chance_cutoffs += 1
+                return done + high * (p + rest)
+            if child_beta <= low:
+                self.chance_cutoffs += 1
+                return done + p * low + rest_lower
+
+            board.push(mv)
+            try:
+                v = self._after_opponent(board, depth, max(child_alpha, low), min(child_beta, high),
+                                         first_value=lower[i])
+            finally:
+                board.pop()
+
+            if v <= child_alpha:
+                self.chance_cutoffs += 1
+                return done + p * v + high * rest
+            if v >= child_beta:
+                self.chance_cutoffs += 1
+                return done + p * v + rest_lower
+            done += p * v
+
+        return done
@@ -1,6 +1,9 @@
+import accumulator
 import chess
-import tensorflow as tf
+import inference
+import vectorize
 import numpy as np
+from collections import OrderedDict
 
 """
 Here we'll put our evaluation functions
@@ -20,6 +23,9 @@ tuned_weights = {chess.PAWN: 2.746,
                  chess.QUEEN: 6.185,
                  chess.KING: 0.953}
 
+# estimated memory taken by an evaluation cache entry in python, in bytes; not measured
+CACHE_ENTRY_BYTES = 400
+
 class Evaluator:
     """
     Evaluator parent class.
@@ -27,6 +33,40 @@ class Evaluator:
     def evaluate(self, game_state, color):
         raise Exception("Undefined!")
 
+    def evaluate_batch(self, game_states, color):
+        """
+        Evaluate several positions for color, returning a list of values.
+        """
+        return [self.evaluate(game_state, color) for game_state in game_states]
+
+    def value_range(self):
+        """
+        (lowest, highest) value evaluate can return, or None if unbounded.
+        """
+        return None
+
+class BatchEvaluator(Evaluator):
+    """
+    Evaluator parent class for models that score feature vectors. Positions are
+    vectorized one at a time, but scored together in a single matrix call, so a
+    search can collect its leaves and evaluate them as one batch. vectorize is told
+    the color the value will be wanted for, which the models themselves ignore.
+    """
+    def vectorize(self, game_state, color=None):
+        raise Exception("Undefined!")
+
+    def evaluate_vectors(self, vectors, color):
+        """
+        Return an array of values for color, one per feature vector.
+        """
+        raise Exception("Undefined!")
+
+    def evaluate(self, game_state, color):
+        return self.evaluate_vectors([self.vectorize(game_state)], color)[0]
+
+    def evaluate_batch(self, game_states, color):
+        return list(self.evaluate_vectors([self.vectorize(game_state) for game_state in game_states], color))
+
 class WeightedPieceCount(Evaluator):
     """
     Encourage loss of pieces according to specified weights.
@@ -35,13 +75,20 @@ class WeightedPieceCount(Evaluator):
         self.weights = weights
 
     def evaluate(self, game_state, color):
-        pieces = game_state.piece_counts
-
-        tot = 0
-        for k in pieces[color]:
-            tot -= pieces[color][k]*self.weights[k]
-
-        return tot
+        pieces = game_state.piece_counts[color]
+        weights = self.weights
+
+        return -(pieces[chess.PAWN] * weights[chess.PAWN] +
+                 pieces[chess.KNIGHT] * weights[chess.KNIGHT] +
+                 pieces[chess.BISHOP] * weights[chess.BISHOP] +
+                 pieces[chess.ROOK] * weights[chess.ROOK] +
+                 pieces[chess.QUEEN] * weights[chess.QUEEN] +
+                 pieces[chess.KING] * weights[chess.KING])
+
+    def value_range(self):
+        # a side never has more than 16 pieces
+        weights = self.weights.values()
+        return (-16 * max(max(weights), 0), -16 * min(min(weights), 0))
         
 class AntiPawn(Evaluator):
     """
@@ -50,6 +97,9 @@ class AntiPawn(Evaluator):
     def evaluate(self, game_state, color):
         return -game_state.piece_counts[color][chess.PAWN]
 
+    def value_range(self):
+        return (-8, 0)
+
 class WeightedPieceCountWCaptures(Evaluator):
     """
     Weighted piece count that takes into account captures
@@ -58,13 +108,7 @@ class WeightedPieceCountWCaptures(Evaluator):
     Might as well search one depth deeper than use this.
     """
     def captures_present(self, game_state, color):
-        # for all legal moves
-        legal_moves = game_state.get_legal_moves()
-        for mv in legal_moves:
-            # check if any move captures
-            if game_state.board.piece_at(mv.to_square):
-                return True
-        return False
+        return game_state.has_capture()
 
     def evaluate(self, game_state, color):        
         weighted_piece_counter = WeightedPieceCount()
@@ -73,112 +117,378 @@ class WeightedPieceCountWCaptures(Evaluator):
         else:
             return weighted_piece_counter.evaluate(game_state, color) + 5
 
-class SoftmaxEval(Evaluator):
+    def value_range(self):
+        low, high = WeightedPieceCount().value_range()
+        return (low - 5, high + 5)
+
+def tf_session():
+    """
+    Import TensorFlow, which only the 'tf' backend of the learned evaluators needs,
+    and open a session for its graph. Returns (tf, session).
+    """
+    import tensorflow as tf
+    return tf, tf.InteractiveSession()
+
+class SoftmaxEval(BatchEvaluator):
     """
     1-layer neural network trained on FICS dataset.
+
+    backend is 'numpy' (the default) to score boards with inference.SoftmaxNet, or
+    'tf' to run the TensorFlow graph.
     """
-    def __init__(self, softmax_model):
+    def __init__(self, softmax_model, backend='numpy'):
         self.softmax_model = softmax_model
         if self.softmax_model.W is None or self.softmax_model.b is None:
             raise Exception('Train softmax first.')
+        self.vectorize_method = vectorize.array_method(self.softmax_model.vectorize_method)
 
-        # tensor for board_vector
-        self.x = tf.placeholder(tf.float32, [1, self.softmax_model.vector_len])
+        self.backend = backend
+        if backend == 'numpy':
+            self.net = inference.SoftmaxNet(self.softmax_model.W, self.softmax_model.b)
+        elif backend == 'tf':
+            tf, self.sess = tf_session()
 
-        # the weight matrix and bias vector
-        W = tf.constant(self.softmax_model.W, dtype=tf.float32)
-        b = tf.constant(self.softmax_model.b, dtype=tf.float32)
+            # tensor for a batch of board vectors
+            self.x = tf.placeholder(tf.float32, [None, self.softmax_model.vector_len])
 
-        self.sess = tf.InteractiveSession()
-        
-        # initialize variables
-        self.sess.run(tf.global_variables_initializer())
+            # the weight matrix and bias vector
+            W = tf.constant(self.softmax_model.W, dtype=tf.float32)
+            b = tf.constant(self.softmax_model.b, dtype=tf.float32)
 
-        # define model with weights and biases calculated
-        self.y = tf.nn.softmax(tf.matmul(self.x, W) + b)
+            # define model with weights and biases calculated
+            self.y = tf.nn.softmax(tf.matmul(self.x, W) + b)
+        else:
+            raise Exception('Unknown backend ' + str(backend) + '.')
 
-    def evaluate(self, game_state, color):
-        board_vector = self.softmax_model.vectorize_method(game_state.board)
+    def vectorize(self, game_state, color=None):
+        return self.vectorize_method(game_state.board)
 
-        # predict new board
-        predict = tf.argmax(self.y,1)
-        x_np = np.array(board_vector).reshape(1,len(board_vector))
-        pred = self.sess.run(predict, feed_dict={self.x: x_np})[0]
+    def predict(self, vectors):
+        if self.backend == 'numpy':
+            return self.net.forward(vectors)
+        x_np = np.array(vectors, dtype=np.float32)
+        return self.sess.run(self.y, feed_dict={self.x: x_np})
+
+    def evaluate_vectors(self, vectors, color):
+        # predict new boards
+        preds = np.argmax(self.predict(vectors), 1)
         if color == chess.WHITE:
-            return pred
+            return preds
         else:
-            return 2 - pred
+            return 2 - preds
+
+    def value_range(self):
+        return (0, 2)
 
-class MultilayerEval(Evaluator):
+class MultilayerEval(BatchEvaluator):
     """
     Multilayer neural net trained on the FICS dataset.
+
+    backend is 'numpy' (the default) to score boards with inference.MultilayerNet, or
+    'tf' to run the TensorFlow graph.
+    """
+    def __init__(self, multilayer_model, backend='numpy'):
+        self.multilayer_model = multilayer_model
+        if not self.multilayer_model.trained():
+            raise Exception('Train multilayer first.')
+        self.vectorize_method = vectorize.array_method(self.multilayer_model.vectorize_method)
+
+        self.backend = backend
+        if backend == 'numpy':
+            self.net = inference.MultilayerNet(self.multilayer_model.W, self.multilayer_model.b)
+        elif backend == 'tf':
+            tf, self.sess = tf_session()
+
+            # tensor for a batch of board vectors
+            self.x = tf.placeholder(tf.float32, [None, self.multilayer_model.n_input])
+
+            # define model with weights and biases calculated
+            self.y = multilayer_model.multilayer_perceptron(self.x, self.multilayer_model.W, self.multilayer_model.b)
+        else:
+            raise Exception('Unknown backend ' + str(backend) + '.')
+
+    def vectorize(self, game_state, color=None):
+        return self.vectorize_method(game_state.board)
+
+    def predict(self, vectors):
+        if self.backend == 'numpy':
+            return self.net.forward(vectors)
+        x_np = np.array(vectors, dtype=np.float32)
+        return self.sess.run(self.y, feed_dict={self.x: x_np})
+
+    def evaluate_vectors(self, vectors, color):
+        # score new boards
+        preds = self.predict(vectors)
+
+        if color == chess.BLACK:
+            return preds[:, 2] - preds[:, 0]
+        else:
+            return preds[:, 0] - preds[:, 2]
+
+    def value_range(self):
+        return (-1, 1)
+
+class IncrementalMultilayerEval(BatchEvaluator):
+    """
+    MultilayerEval for networks on a vectorization of single pieces (see
+    accumulator.features), with the first layer kept up to date by an Accumulator on
+    the board as moves are pushed and popped. Only the two smaller layers are computed
+    per position.
     """
     def __init__(self, multilayer_model):
         self.multilayer_model = multilayer_model
-        if self.multilayer_model.W is None or self.multilayer_model.b is None:
+        if not self.multilayer_model.trained():
             raise Exception('Train multilayer first.')
+        if not accumulator.incremental(self.multilayer_model.vectorize_method):
+            raise Exception('Multilayer vectorization cannot be updated incrementally.')
+
+        self.net = inference.MultilayerNet(self.multilayer_model.W, self.multilayer_model.b)
+        self.key = id(self)
+
+    def accumulator(self, game_state):
+        """
+        This evaluator's Accumulator on game_state, attached on first use.
+        """
+        acc = game_state.accumulators.get(self.key)
+        if acc is None:
+            W, b = self.multilayer_model.W, self.multilayer_model.b
+            acc = accumulator.Accumulator(W['h1'], b['b1'], self.multilayer_model.vectorize_method)
+            game_state.accumulators[self.key] = acc
+        return acc
+
+    def vectorize(self, game_state, color=None):
+        # the first layer's values stand in for the feature vector
+        return self.accumulator(game_state).values(game_state).copy()
+
+    def evaluate_vectors(self, vectors, color):
+        preds = self.net.forward_hidden(np.array(vectors, dtype=np.float32).reshape(len(vectors), -1))
 
-        # tensor for board_vector
-        self.x = tf.placeholder(tf.float32, [1, self.multilayer_model.n_input])
+        if color == chess.BLACK:
+            return preds[:, 2] - preds[:, 0]
+        else:
+            return preds[:, 0] - preds[:, 2]
 
-        self.sess = tf.InteractiveSession()
-        
-        # initialize variables
-        self.sess.run(tf.global_variables_initializer())
+    def value_range(self):
+        return (-1, 1)
 
-        # define model with weights and biases calculated
-        self.y = multilayer_model.multilayer_perceptron(self.x, self.multilayer_model.W, self.multilayer_model.b)
+class QuantizedMultilayerEval(BatchEvaluator):
+    """
+    MultilayerEval for a network quantized to int8 weights (see quantize.py).
+    """
+    def __init__(self, quantized_model):
+        self.quantized_model = quantized_model
+        self.vectorize_method = vectorize.array_method(self.quantized_model.vectorize_method)
 
-    def evaluate(self, game_state, color):
-        board_vector = self.multilayer_model.vectorize_method(game_state.board)
+    def vectorize(self, game_state, color=None):
+        return self.vectorize_method(game_state.board)
+
+    def evaluate_vectors(self, vectors, color):
+        preds = self.quantized_model.forward(vectors)
 
-        # score new board
-        score = self.y
-        x_np = np.array(board_vector).reshape(1,len(board_vector))
-        preds = self.sess.run(score, feed_dict={self.x: x_np})[0]
-    
         if color == chess.BLACK:
-            # print preds[2] - preds[0]
-            return preds[2] - preds[0]
+            return preds[:, 2] - preds[:, 0]
         else:
-            # print preds[0] - preds[2]
-            return preds[0] - preds[2]
+            return preds[:, 0] - preds[:, 2]
+
+    def value_range(self):
+        return (-1, 1)
 
-class TDTrainEval(Evaluator):
+class TDTrainEval(BatchEvaluator):
     """
     Attempted implementation of the Q-reinforcement learning algorithm 
     described in Lai (2015). Not yet functional.
     """
-    def __init__(self, model):
+    def __init__(self, model, backend='numpy'):
         self.model = model
         if self.model.W is None or self.model.b is None:
             raise Exception('Initialize/train model first.')
+        self.vectorize_method = vectorize.array_method(self.model.vectorize_method)
 
-        # tensor for board_vector
-        self.x = tf.placeholder(tf.float32, [1, self.model.vector_len])
+        self.backend = backend
+        if backend == 'numpy':
+            self.net = inference.SoftmaxNet(self.model.W, self.model.b)
+        elif backend == 'tf':
+            tf, self.sess = tf_session()
 
-        # the weight matrix and bias vector
-        W = tf.constant(self.model.W, dtype=tf.float32)
-        b = tf.constant(self.model.b, dtype=tf.float32)
+            # tensor for a batch of board vectors
+            self.x = tf.placeholder(tf.float32, [None, self.model.vector_len])
 
-        self.sess = tf.InteractiveSession()
-        
-        # initialize variables
-        self.sess.run(tf.global_variables_initializer())
+            # the weight matrix and bias vector
+            W = tf.constant(self.model.W, dtype=tf.float32)
+            b = tf.constant(self.model.b, dtype=tf.float32)
+
+            # define model with weights and biases calculated
+            self.y = tf.nn.softmax(tf.matmul(self.x, W) + b)
+        else:
+            raise Exception('Unknown backend ' + str(backend) + '.')
 
-        # define model with weights and biases calculated
-        self.y = tf.nn.softmax(tf.matmul(self.x, W) + b)
+    def vectorize(self, game_state, color=None):
+        return self.vectorize_method(game_state.board)
 
-    def evaluate(self, game_state, color):
-        board_vector = self.model.vectorize_method(game_state.board)
+    def predict(self, vectors):
+        if self.backend == 'numpy':
+            return self.net.forward(vectors)
+        x_np = np.array(vectors, dtype=np.float32)
+        return self.sess.run(self.y, feed_dict={self.x: x_np})
 
-        # predict new board
-        predict = tf.argmax(self.y,1)
-        x_np = np.array(board_vector).reshape(1,len(board_vector))
-        pred = self.sess.run(predict, feed_dict={self.x: x_np})[0]
+    def evaluate_vectors(self, vectors, color):
+        # predict new boards
+        preds = np.argmax(self.predict(vectors), 1)
 
         if color == chess.WHITE:
-            return pred
+            return preds
         else:
-            return 1 - pred
- 
\ No newline at end of file
+            return 1 - preds
+
+class LazyCascadeEval(Evaluator):
+    """
+    Material first, the learned evaluator only when it could matter. The value is
+    cheap + weight * expensive, but a search that passes its window to
+    evaluate_bounded only pays for expensive when the cheap score is within margin of
+    the window; otherwise the cheap score plus or minus margin is returned, as a bound
+    on the far side of the window.
+
+    margin defaults to weight times the largest value expensive can take, which makes
+    the bounds safe; a smaller margin saves more evaluations at some risk of error.
+    cheap_only and full count the two kinds of evaluation.
+    """
+    def __init__(self, expensive, cheap=None, weight=1.0, margin=None):
+        self.expensive = expensive
+        self.cheap = cheap or WeightedPieceCount()
+        self.weight = weight
+        if margin is None:
+            value_range = expensive.value_range()
+            if value_range is None:
+                raise Exception('Give a margin for an unbounded evaluator.')
+            margin = weight * max(abs(value_range[0]), abs(value_range[1]))
+        self.margin = margin
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.cheap_only = 0
+        self.full = 0
+
+    def evaluate(self, game_state, color):
+        self.full += 1
+        return self.cheap.evaluate(game_state, color) + self.weight * self.expensive.evaluate(game_state, color)
+
+    def evaluate_bounded(self, game_state, color, alpha, beta):
+        """
+        The value for color, or a bound on it if it lies outside (alpha, beta): at most
+        alpha, or at least beta.
+        """
+        score = self.cheap.evaluate(game_state, color)
+        if score + self.margin <= alpha:
+            self.cheap_only += 1
+            return score + self.margin
+        if score - self.margin >= beta:
+            self.cheap_only += 1
+            return score - self.margin
+        self.full += 1
+        return score + self.weight * self.expensive.evaluate(game_state, color)
+
+    def value_range(self):
+        cheap, expensive = self.cheap.value_range(), self.expensive.value_range()
+        if cheap is None or expensive is None:
+            return None
+        low, high = sorted([self.weight * expensive[0], self.weight * expensive[1]])
+        return (cheap[0] + low, cheap[1] + high)
+
+class CachedEvaluator(Evaluator):
+    """
+    Wraps an evaluator with a cache of its values, keyed by (zobrist hash, color) and
+    holding at most max_entries, least recently used first out. One cache can be
+    shared by several agents using the same evaluator. Use cache_evaluator to wrap an
+    evaluator, so that batched evaluators stay batched.
+    """
+    def __init__(self, evaluator, max_entries=100000):
+        self.evaluator = evaluator
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """
+        The cached value of key, or None, marking it as the most recently used.
+        """
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        if len(self.entries) >= self.max_entries:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+
+    def evaluate(self, game_state, color):
+        key = (game_state.zobrist_hash, color)
+        value = self.lookup(key)
+        if value is None:
+            value = self.evaluator.evaluate(game_state, color)
+            self.store(key, value)
+        return value
+
+    def value_range(self):
+        return self.evaluator.value_range()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def memory_use(self):
+        """
+        Estimated memory taken by the cache, in bytes, from CACHE_ENTRY_BYTES.
+        """
+        return len(self.entries) * CACHE_ENTRY_BYTES
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return '%d entries (about %.1f MB est.), hit rate %.1f%%' % (len(self.entries), self.memory_use() / 2.0 ** 20,
+                                                                   100 * self.hit_rate())
+
+class CachedBatchEvaluator(CachedEvaluator, BatchEvaluator):
+    """
+    CachedEvaluator for a BatchEvaluator. vectorize returns a (key, value, vector)
+    triple: positions found in the cache are not vectorized, and evaluate_vectors
+    only scores the rest, in one batch.
+    """
+    def vectorize(self, game_state, color=None):
+        key = (game_state.zobrist_hash, color)
+        value = self.lookup(key)
+        if value is not None:
+            return key, value, None
+        return key, None, self.evaluator.vectorize(game_state, color)
+
+    def evaluate_vectors(self, vectors, color):
+        values = [value for key, value, vector in vectors]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            scores = self.evaluator.evaluate_vectors([vectors[i][2] for i in missing], color)
+            for i, score in zip(missing, scores):
+                values[i] = score
+                key = vectors[i][0]
+                self.store(key if key[1] == color else (key[0], color), score)
+        return values
+
+    def evaluate(self, game_state, color):
+        return CachedEvaluator.evaluate(self, game_state, color)
+
+    def evaluate_batch(self, game_states, color):
+        return self.evaluate_vectors([self.vectorize(game_state, color) for game_state in game_states], color)
+
+def cache_evaluator(evaluator, max_entries=100000):
+    """
+    evaluator wrapped in a cache of max_entries values.
+    """
+    if isinstance(evaluator, BatchEvaluator):
+        return CachedBatchEvaluator(evaluator, max_entries)
+    return CachedEvaluator(evaluator, max_entries)
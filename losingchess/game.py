@@ -1,5 +1,7 @@
 import vectorize
 
+import time
+
 class Game:
     """
     Here we build the processes that controls the games flow between two agents.
@@ -10,7 +12,30 @@ class Game:
         self.a2 = a2
         self.get_stats = get_stats
 
-    def play(self, max_turns=None):
+        # seconds spent in get_move and moves made, for a1 and a2
+        self.think_time = [0.0, 0.0]
+        self.moves_made = [0, 0]
+
+    def play(self, max_turns=None, time_limit=None):
+        """
+        Play the game out. A time_limit (seconds per move) replaces both agents'
+        fixed search depth with an iteratively deepened search on that budget.
+        The agents' worker processes are shut down when the game ends.
+        """
+        if time_limit is not None:
+            self.a1.time_limit = time_limit
+            self.a2.time_limit = time_limit
+
+        try:
+            return self.play_out(max_turns)
+        finally:
+            self.a1.close()
+            self.a2.close()
+
+    def play_out(self, max_turns=None):
+        """
+        Alternate the agents' moves until the game ends or max_turns is reached.
+        """
         position_values = []
         board_vectors = []
         while True:
@@ -22,7 +47,10 @@ class Game:
                     break
 
                 # agent finds best move
+                start = time.time()
                 move_val_pair = agent.get_move(self)
+                self.think_time[turn] += time.time() - start
+                self.moves_made[turn] += 1
 
                 # if there are no moves to be made
                 if move_val_pair is None:
@@ -0,0 +1,95 @@
+import numpy as np
+
+"""
+NumPy forward passes for the learned evaluators, so that trained models can be used
+for play without TensorFlow. Weights are converted to float32 once, and each layer
+writes into a buffer kept from call to call, so that scoring a batch of boards does
+not allocate. The arithmetic follows the TensorFlow graphs of softmax.py and
+multilayer.py: float32 matrix products, relu, and a softmax computed after
+subtracting the row maximum.
+"""
+
+# rows the buffers are first made for; they grow to the largest batch seen
+INITIAL_BATCH = 64
+
+def softmax(logits):
+    """
+    Softmax over the rows of logits, in place. Returns logits.
+    """
+    logits -= logits.max(axis=1)[:, np.newaxis]
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=1)[:, np.newaxis]
+    return logits
+
+class Network:
+    """
+    Network parent class. layers is a list of (W, b) float32 pairs; forward returns
+    the output for a batch of feature vectors as a view into a buffer, which the next
+    call overwrites.
+    """
+    def __init__(self, layers):
+        self.layers = [(np.ascontiguousarray(W, dtype=np.float32),
+                        np.ascontiguousarray(b, dtype=np.float32).reshape(-1))
+                       for W, b in layers]
+        self.n_input = self.layers[0][0].shape[0]
+        self.buffers = None
+        self.allocate(INITIAL_BATCH)
+
+    def allocate(self, rows):
+        self.buffers = [np.empty((rows, W.shape[1]), dtype=np.float32) for W, b in self.layers]
+
+    def inputs(self, vectors):
+        x = np.asarray(vectors, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        if x.shape[1] != self.n_input:
+            raise Exception('Expected feature vectors of length ' + str(self.n_input) + '.')
+        if x.shape[0] > self.buffers[0].shape[0]:
+            self.allocate(x.shape[0])
+        return x
+
+    def layer(self, i, x):
+        """
+        x.W + b of layer i, written into its buffer.
+        """
+        W, b = self.layers[i]
+        out = self.buffers[i][:x.shape[0]]
+        np.dot(x, W, out=out)
+        out += b
+        return out
+
+    def forward(self, vectors):
+        raise Exception("Undefined!")
+
+class SoftmaxNet(Network):
+    """
+    The 1-layer network of softmax.py: softmax(x.W + b).
+    """
+    def __init__(self, W, b):
+        Network.__init__(self, [(W, b)])
+
+    def forward(self, vectors):
+        return softmax(self.layer(0, self.inputs(vectors)))
+
+class MultilayerNet(Network):
+    """
+    The network of multilayer.py: two relu hidden layers and a softmax output. W and b
+    are the dicts of the Multilayer model, keyed 'h1', 'h2', 'out' and 'b1', 'b2', 'out'.
+    """
+    def __init__(self, W, b):
+        Network.__init__(self, [(W['h1'], b['b1']), (W['h2'], b['b2']), (W['out'], b['out'])])
+
+    def forward(self, vectors):
+        return self.forward_hidden(self.layer(0, self.inputs(vectors)))
+
+    def forward_hidden(self, layer_1):
+        """
+        The output for a batch of first hidden layer values before the relu, which
+        incremental evaluators keep up to date themselves. layer_1 is overwritten.
+        """
+        if layer_1.shape[0] > self.buffers[1].shape[0]:
+            self.allocate(layer_1.shape[0])
+        np.maximum(layer_1, 0, out=layer_1)
+        layer_2 = self.layer(1, layer_1)
+        np.maximum(layer_2, 0, out=layer_2)
+        return softmax(self.layer(2, layer_2))
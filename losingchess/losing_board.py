@@ -1,6 +1,21 @@
 import chess
 from copy import deepcopy
 
+PIECE_TYPES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]
+
+# pawns may promote to a king in losing chess
+PROMOTION_TYPES = [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT, chess.KING]
+
+# Zobrist keys taken from the fixed polyglot table, so position hashes are the same
+# in every process and on every run. ZOBRIST_PIECES[color][piece_type][square]
+ZOBRIST_PIECES = [[[chess.POLYGLOT_RANDOM_ARRAY[64 * ((piece_type - 1) * 2 + color) + square]
+                    for square in chess.SQUARES]
+                   if piece_type else None
+                   for piece_type in range(7)]
+                  for color in [chess.BLACK, chess.WHITE]]
+ZOBRIST_EP_FILES = chess.POLYGLOT_RANDOM_ARRAY[772:780]
+ZOBRIST_WHITE_TURN = chess.POLYGLOT_RANDOM_ARRAY[780]
+
 class LosingBoard:
     """
     Wrapper for the python-chess Board class that encodes the rules of losing chess
@@ -12,107 +27,323 @@ class LosingBoard:
     -> First player to lose all pieces wins.
     -> Attacking pieces must capture opponent's piece.
     -> Kings are normal: no castling, check.
+    -> En passant counts as a capture, and pawns may promote to kings.
     """
 
     def __init__(self, no_kings=False, b_fen='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'):
-        k=1
         self.no_kings = no_kings
         if self.no_kings:
             self.board = chess.Board(fen='rnbq1bnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQ1BNR w Qq - 0 1')
-            k=0
         else:
             self.board = chess.Board(fen=b_fen)
 
-        self.piece_counts = { color: {
-                                        chess.PAWN: 8,
-                                        chess.ROOK: 2,
-                                        chess.BISHOP: 2,
-                                        chess.QUEEN: 1,
-                                        chess.KING: k,
-                                        chess.KNIGHT: 2,
-                                    }
+        # piece_counts[color][piece_type], indexed by the python-chess constants
+        # (index 0 is unused), and piece_totals[color] summed over all types
+        self.piece_counts = [[0] * 7, [0] * 7]
+        self.piece_totals = [0, 0]
+        for color in [chess.WHITE, chess.BLACK]:
+            for piece_type in PIECE_TYPES:
+                n = len(self.board.pieces(piece_type, color))
+                self.piece_counts[color][piece_type] = n
+                self.piece_totals[color] += n
+        self.game_over = self.piece_totals[chess.WHITE] == 0 or self.piece_totals[chess.BLACK] == 0
+
+        # 64-bit position key over piece placement, side to move and en passant square
+        self._zobrist_hash = self.compute_zobrist_hash()
+
+        # (captured piece, promotion, game over flag, zobrist hash) for each pushed
+        # move, consumed by pop
+        self.undo_stack = []
 
-                             for color in [chess.WHITE, chess.BLACK]
-                            }
+        # incrementally updated evaluator state (see accumulator.py), keyed by evaluator;
+        # push and pop tell each of them which pieces moved
+        self.accumulators = {}
 
     def get_legal_moves(self):
         """
         Return list of all legal moves for a color given the current gamestate.
         Since the Board class knows whose turn it is, we need not take a color argument.
+
+        Captures are compulsory, so quiet moves are only generated when there is no capture.
+        """
+        moves = self.generate_captures()
+        if moves:
+            return moves
+        return self.generate_quiet_moves()
+
+    def generate_captures(self):
+        """
+        Return list of all captures (en passant included) for the side to move.
+        Works on the python-chess bitboards, intersecting attack masks with enemy pieces.
+        """
+        board = self.board
+        turn = board.turn
+        ours = board.occupied_co[turn]
+        theirs = board.occupied_co[not turn]
+        moves = []
+
+        # piece captures
+        pieces = ours & ~board.pawns
+        while pieces:
+            bb = pieces & -pieces
+            pieces ^= bb
+            from_square = bb.bit_length() - 1
+            targets = board.attacks_mask(from_square) & theirs
+            while targets:
+                bb = targets & -targets
+                targets ^= bb
+                moves.append(chess.Move(from_square, bb.bit_length() - 1))
+
+        # pawn captures, promoting on the back rank
+        pawns = ours & board.pawns
+        pawn_attacks = chess.BB_PAWN_ATTACKS[turn]
+        capturers = pawns
+        while capturers:
+            bb = capturers & -capturers
+            capturers ^= bb
+            from_square = bb.bit_length() - 1
+            targets = pawn_attacks[from_square] & theirs
+            while targets:
+                bb = targets & -targets
+                targets ^= bb
+                to_square = bb.bit_length() - 1
+                if bb & chess.BB_BACKRANKS:
+                    for promotion in PROMOTION_TYPES:
+                        moves.append(chess.Move(from_square, to_square, promotion))
+                else:
+                    moves.append(chess.Move(from_square, to_square))
+
+        # en passant captures
+        ep_square = board.ep_square
+        if ep_square:
+            capturers = pawns & chess.BB_PAWN_ATTACKS[not turn][ep_square]
+            while capturers:
+                bb = capturers & -capturers
+                capturers ^= bb
+                moves.append(chess.Move(bb.bit_length() - 1, ep_square))
+
+        return moves
+
+    def generate_quiet_moves(self):
         """
-        legal_moves = []
-
-        # get pseudo legal moves under normal chess rules (includes putting king into check)
-        chess_legal_moves = self.board.pseudo_legal_moves
-        # check for attacking positions
-        # if one is found, we only include attacking moves among legal moves
-        attacking = False
-        for mv in chess_legal_moves:
-            if self.board.piece_at(mv.to_square):
-                legal_moves.append(mv)
-                attacking = True
-        if attacking:
-            return legal_moves
+        Return list of all non-capturing moves for the side to move. Castling is never generated.
+        """
+        board = self.board
+        turn = board.turn
+        empty = ~board.occupied & chess.BB_ALL
+        moves = []
+
+        # piece moves
+        pieces = board.occupied_co[turn] & ~board.pawns
+        while pieces:
+            bb = pieces & -pieces
+            pieces ^= bb
+            from_square = bb.bit_length() - 1
+            targets = board.attacks_mask(from_square) & empty
+            while targets:
+                bb = targets & -targets
+                targets ^= bb
+                moves.append(chess.Move(from_square, bb.bit_length() - 1))
+
+        # single and double pawn pushes
+        pawns = board.occupied_co[turn] & board.pawns
+        if turn == chess.WHITE:
+            single_moves = (pawns << 8) & empty
+            double_moves = (single_moves << 8) & empty & chess.BB_RANK_4
+            step = -8
         else:
-            # take out castling moves
-            out_moves = [move for move in list(chess_legal_moves) if not self.board.is_castling(move)]
-            return out_moves
+            single_moves = (pawns >> 8) & empty
+            double_moves = (single_moves >> 8) & empty & chess.BB_RANK_5
+            step = 8
+
+        while single_moves:
+            bb = single_moves & -single_moves
+            single_moves ^= bb
+            to_square = bb.bit_length() - 1
+            if bb & chess.BB_BACKRANKS:
+                for promotion in PROMOTION_TYPES:
+                    moves.append(chess.Move(to_square + step, to_square, promotion))
+            else:
+                moves.append(chess.Move(to_square + step, to_square))
 
-    def move(self, mv):
+        while double_moves:
+            bb = double_moves & -double_moves
+            double_moves ^= bb
+            to_square = bb.bit_length() - 1
+            moves.append(chess.Move(to_square + 2 * step, to_square))
+
+        return moves
+
+    def has_capture(self):
         """
-        Push move mv to true board.
+        Return true if the side to move has a capture, and so must capture.
+        Exits on the first capture found without building any moves.
+        """
+        board = self.board
+        turn = board.turn
+        ours = board.occupied_co[turn]
+        theirs = board.occupied_co[not turn]
+        pawns = ours & board.pawns
+
+        # all pawn captures at once by shifting the pawn bitboard
+        if turn == chess.WHITE:
+            pawn_targets = ((pawns << 7) & ~chess.BB_FILE_H) | ((pawns << 9) & ~chess.BB_FILE_A)
+        else:
+            pawn_targets = ((pawns >> 9) & ~chess.BB_FILE_H) | ((pawns >> 7) & ~chess.BB_FILE_A)
+        if pawn_targets & theirs:
+            return True
+
+        if board.ep_square and pawns & chess.BB_PAWN_ATTACKS[not turn][board.ep_square]:
+            return True
+
+        pieces = ours & ~board.pawns
+        while pieces:
+            bb = pieces & -pieces
+            pieces ^= bb
+            if board.attacks_mask(bb.bit_length() - 1) & theirs:
+                return True
+
+        return False
+
+    def push(self, mv):
+        """
+        Push move mv to true board, remembering what is needed to undo it with pop.
         """
+        board = self.board
+        turn = board.turn
+        counts = self.piece_counts
+
+        p = board.piece_at(mv.to_square)
 
-        p = self.board.piece_at(mv.to_square)
+        # en passant captures land on an empty square
+        if p is None and board.ep_square and mv.to_square == board.ep_square \
+                and board.piece_type_at(mv.from_square) == chess.PAWN:
+            p = chess.Piece(chess.PAWN, not turn)
 
-        # decrement count of pieces if one is captured
+        self.undo_stack.append((p, mv.promotion, self.game_over, self._zobrist_hash))
+
+        # move the piece in the hash, and take out the captured piece and old en passant file
+        mover_type = board.piece_type_at(mv.from_square)
+        h = self._zobrist_hash ^ ZOBRIST_WHITE_TURN
+        h ^= ZOBRIST_PIECES[turn][mover_type][mv.from_square]
+        h ^= ZOBRIST_PIECES[turn][mv.promotion or mover_type][mv.to_square]
+        if p:
+            # an en passant capture takes the pawn off the square behind to_square
+            captured_square = mv.to_square if board.piece_type_at(mv.to_square) else mv.to_square + (-8 if turn else 8)
+            h ^= ZOBRIST_PIECES[p.color][p.piece_type][captured_square]
+        if board.ep_square:
+            h ^= ZOBRIST_EP_FILES[chess.file_index(board.ep_square)]
+
+        # decrement count of pieces if one is captured; only a capture can end the game
         if p:
-            isWhite = str(p).isupper()
-            self.piece_counts[isWhite][p.piece_type] -= 1
-        elif mv.promotion is not None:
-            isWhite = str(mv.promotion).isupper()
-            self.piece_counts[isWhite][mv.promotion] += 1
-            self.piece_counts[isWhite][chess.PAWN] -= 1
+            counts[p.color][p.piece_type] -= 1
+            self.piece_totals[p.color] -= 1
+            if self.piece_totals[p.color] == 0:
+                self.game_over = True
+        # a promoting pawn becomes a new piece of the mover's color
+        if mv.promotion is not None:
+            counts[turn][mv.promotion] += 1
+            counts[turn][chess.PAWN] -= 1
 
         # make move
-        self.board.push(mv)
+        board.push(mv)
 
-        # update piece counts
-        for color in [chess.WHITE, chess.BLACK]:
-            for piece_type in [chess.PAWN, chess.ROOK, chess.BISHOP, chess.QUEEN, chess.KING, chess.KNIGHT]:
-                pieces = self.board.pieces(piece_type, color)
-                if pieces is not None:
-                    self.piece_counts[color][piece_type] = len(pieces)
-                else:
-                    self.piece_counts[color][piece_type] = 0
+        if board.ep_square:
+            h ^= ZOBRIST_EP_FILES[chess.file_index(board.ep_square)]
+        self._zobrist_hash = h
+
+        if self.accumulators:
+            changes = self.piece_changes(mv, turn, mover_type, p, p and captured_square)
+            for accumulator in self.accumulators.values():
+                accumulator.push(changes, turn, h)
+
+    def pop(self):
+        """
+        Undo the last move pushed, restoring board state and piece counts exactly.
+        """
+        mv = self.board.pop()
+        captured, promotion, self.game_over, self._zobrist_hash = self.undo_stack.pop()
+        counts = self.piece_counts
+
+        # the mover is once again the side to move
+        if promotion is not None:
+            counts[self.board.turn][promotion] -= 1
+            counts[self.board.turn][chess.PAWN] += 1
+        if captured:
+            counts[captured.color][captured.piece_type] += 1
+            self.piece_totals[captured.color] += 1
+
+        if self.accumulators:
+            # the captured piece is back, behind to_square if taken en passant
+            turn = self.board.turn
+            captured_square = None
+            if captured:
+                captured_square = mv.to_square if self.board.piece_type_at(mv.to_square) else mv.to_square + (-8 if turn else 8)
+            changes = self.piece_changes(mv, turn, self.board.piece_type_at(mv.from_square), captured, captured_square)
+            for accumulator in self.accumulators.values():
+                accumulator.pop(changes, turn, self._zobrist_hash)
+
+        return mv
+
+    def piece_changes(self, mv, mover, mover_type, captured, captured_square):
+        """
+        (color, piece type, square, +1 or -1) for each piece placed or removed by mv.
+        """
+        changes = [(mover, mover_type, mv.from_square, -1), (mover, mv.promotion or mover_type, mv.to_square, 1)]
+        if captured:
+            changes.append((captured.color, captured.piece_type, captured_square, -1))
+        return changes
+
+    def move(self, mv):
+        """
+        Push move mv to true board.
+        """
+        self.push(mv)
 
     def generate_successor(self, mv):
         """
         Generate successor board given move mv without modifying the true board.
+        Searches should prefer push/pop, which avoid copying the board.
         """
         new_board = deepcopy(self)
         new_board.move(mv)
         return new_board
 
 
+    @property
+    def zobrist_hash(self):
+        """
+        64-bit Zobrist key of the position, kept up to date by push and pop.
+        """
+        return self._zobrist_hash
+
+    def compute_zobrist_hash(self):
+        """
+        Compute the Zobrist key of the position from scratch.
+        """
+        h = 0
+        for color in [chess.WHITE, chess.BLACK]:
+            for piece_type in PIECE_TYPES:
+                for square in self.board.pieces(piece_type, color):
+                    h ^= ZOBRIST_PIECES[color][piece_type][square]
+        if self.board.turn == chess.WHITE:
+            h ^= ZOBRIST_WHITE_TURN
+        if self.board.ep_square:
+            h ^= ZOBRIST_EP_FILES[chess.file_index(self.board.ep_square)]
+        return h
+
     def is_game_over(self):
         """
         Return true if all of one player's pieces have been consumed.
         """
-        for k in self.piece_counts:
-            if all(v == 0 for v in self.piece_counts[k].values()):
-                return True
-        return False
+        return self.game_over
 
     def winner_by_pieces(self):
         """
         Return chess.WHITE if white has fewer peices, chess.BLACK if black has fewer, 0.5 if same
         """
-        num_white = 0
-        num_black = 0
-        for piece_type in [chess.PAWN, chess.ROOK, chess.BISHOP, chess.QUEEN, chess.KING, chess.KNIGHT]:
-            num_white += len(self.board.pieces(piece_type, chess.WHITE))
-            num_black += len(self.board.pieces(piece_type, chess.BLACK))
+        num_white = self.piece_totals[chess.WHITE]
+        num_black = self.piece_totals[chess.BLACK]
 
         if num_white < num_black:
             return chess.WHITE
@@ -141,6 +372,17 @@ class LosingBoard:
     def ep_square(self):
         return self.board.ep_square
 
+    def fen(self):
+        """
+        Fen of the position, for rebuilding it in another process. python-chess only
+        writes an en passant square whose capture is legal in standard chess, but here
+        the capture may be legal (and forced) with the king attacked, so it is always written.
+        """
+        fields = self.board.fen().split(' ')
+        if self.board.ep_square:
+            fields[3] = chess.SQUARE_NAMES[self.board.ep_square]
+        return ' '.join(fields)
+
     def turn(self):
         return self.board.turn
 
@@ -1,5 +1,8 @@
 import chess_agents
 import evaluation
+import mcts
+import pn_search
+import model_registry
 import vectorize
 import play
 
@@ -8,34 +11,90 @@ import sys
 # maps from arguments to possible agents and evaluators
 agent_choices = {'human': chess_agents.HumanAgent, 'random': chess_agents.RandomAgent, 
                  'minimax': chess_agents.MinimaxAgent, 'alpha_beta': chess_agents.AlphaBetaAgent, 
-                 'expectimax': chess_agents.ExpectimaxAgent}
+                 'expectimax': chess_agents.ExpectimaxAgent, 'proof_number': pn_search.ProofNumberAgent,
+                 'mcts': mcts.MCTSAgent}
 
+# learned evaluators are saved models, named 'name' or 'name@version' (see model_registry);
+# 'softmax', 'multilayer' and 'TD' pick the latest model saved by the train command
 eval_choices = {'weighted_count': evaluation.WeightedPieceCount, 'anti_pawn': evaluation.AntiPawn, 
-                'weighted_count_captures': evaluation.WeightedPieceCountWCaptures, 'softmax': evaluation.SoftmaxEval, 
-                'multilayer': evaluation.MultilayerEval, 'TD': evaluation.TDTrainEval, 'none': None, 'None': None}
+                'weighted_count_captures': evaluation.WeightedPieceCountWCaptures, 'softmax': 'softmax', 
+                'multilayer': 'multilayer', 'TD': 'td', 'none': None, 'None': None}
 
 # parameters for training the learning methods
 td_parameters = 10, 10, 1, 1, 0.7, 12, False, vectorize.piece_count_vector
 softmax_parameters = 10, 10, 1, 1, vectorize.piece_count_vector
 multilayer_parameters = 10, 10, 1, 1, vectorize.piece_count_vector
 
-# validate and sort input 
+def parse_depth(arg):
+    """
+    A depth argument is either a search depth ('3') or a time limit per move in seconds ('2.5s').
+    Returns (depth, time_limit).
+    """
+    if arg.endswith('s'):
+        return 1, float(arg[:-1])
+    return int(arg), None
+
+def parse_eval(arg):
+    """
+    An evaluator argument is one of eval_choices or a saved model spec.
+    """
+    if arg in eval_choices:
+        spec = eval_choices[arg]
+        if not isinstance(spec, str):
+            return spec
+    else:
+        spec = arg
+
+    name, version = model_registry.parse_spec(spec)
+    saved = model_registry.versions(name)
+    if not saved or (version is not None and version not in saved):
+        print 'No saved model ' + spec + '. Train one with: python losing_chess.py train ' + name
+        sys.exit()
+    return spec
+
 args = sys.argv[1:]
+
+# training and listing saved models
+if args and args[0] == 'train':
+    if len(args) not in (2, 3) or args[1] not in model_registry.evaluators:
+        print 'Usage: python losing_chess.py train softmax|multilayer|td [name]'
+        sys.exit()
+    name = args[2] if len(args) == 3 else args[1]
+    version = play.train_model(args[1], name, td_parameters, softmax_parameters, multilayer_parameters)
+    print 'Saved model ' + name + '@' + str(version)
+    sys.exit()
+
+if args and args[0] == 'quantize':
+    if len(args) not in (2, 3):
+        print 'Usage: python losing_chess.py quantize name[@version] [number of FICS data sets]'
+        sys.exit()
+    print 'Saved model ' + play.quantize_model(args[1], *[int(arg) for arg in args[2:]])
+    sys.exit()
+
+if args == ['models']:
+    for name, version in model_registry.list_models():
+        print name + '@' + str(version)
+    sys.exit()
+
+# validate and sort input 
 if len(args) != 6:
     print 'Usage: python losing_chess.py agent_1 eval_func_1 depth_1 agent_2 eval_func_2 depth_2'
+    print 'A depth may instead be a time limit per move in seconds, e.g. 2.5s'
+    print 'An evaluator may be a saved model, e.g. softmax@2; see python losing_chess.py models'
     sys.exit()
 
 try:
     agent_1 = agent_choices[args[0]]
-    eval_func_1 = eval_choices[args[1]]
-    depth_1 = 1 if args[2] is None else int(args[2])
+    eval_func_1 = parse_eval(args[1])
+    depth_1, time_limit_1 = parse_depth(args[2])
 
     agent_2 = agent_choices[args[3]]
-    eval_func_2 = eval_choices[args[4]]
-    depth_2 = 1 if args[2] is None else int(args[5])
-except KeyError:
+    eval_func_2 = parse_eval(args[4])
+    depth_2, time_limit_2 = parse_depth(args[5])
+except (KeyError, ValueError):
     print 'Invalid option'
     sys.exit()
 
 # play the game
-play.play_game(agent_1, eval_func_1, depth_1, agent_2, eval_func_2, depth_2, td_parameters, softmax_parameters, multilayer_parameters)
\ No newline at end of file
+play.play_game(agent_1, eval_func_1, depth_1, agent_2, eval_func_2, depth_2,
+               time_limit_1=time_limit_1, time_limit_2=time_limit_2)
@@ -0,0 +1,226 @@
+import chess
+import chess_agents
+import losing_board
+import worker_pool
+
+import math
+import multiprocessing
+import random
+import time
+
+"""
+Monte Carlo tree search (UCT) for losing chess.
+"""
+
+def rollout(board, max_plies=200):
+    """
+    Play random moves from board until the game ends or max_plies have been played, and
+    return the winner by LosingBoard.winner_by_pieces. The board is left unchanged.
+    """
+    plies = 0
+    while plies < max_plies and not board.is_game_over():
+        moves = board.get_legal_moves()
+        if not moves:
+            break
+        board.push(random.choice(moves))
+        plies += 1
+
+    winner = board.winner_by_pieces()
+    for i in range(plies):
+        board.pop()
+    return winner
+
+def _rollout_task(task):
+    fen, max_plies = task
+    return rollout(losing_board.LosingBoard(b_fen=fen), max_plies)
+
+class Node:
+    """
+    A position in the search tree, reached by move from parent. score sums the results
+    of the playouts through it for player, the side that made move.
+    """
+    def __init__(self, move=None, parent=None, player=None, key=None, prior=1.0):
+        self.move = move
+        self.parent = parent
+        self.player = player
+        self.key = key
+        self.prior = prior
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.score = 0.0
+
+class MCTSAgent(chess_agents.Agent):
+    """
+    Agent that picks the most visited move of a UCT search.
+
+    -> Each move gets playouts simulations, or as many as fit in time_limit seconds.
+    -> Playouts are random games using the capture-first move generator, cut off after
+       rollout_plies and scored by winner_by_pieces.
+    -> With use_priors, untried moves are expanded best first by eval_func and
+       selection uses the PUCT rule, with priors a softmax of the evaluations.
+    -> The subtree of the position reached is kept from move to move, found again from
+       the moves pushed on the board since.
+    -> With rollout_processes, each round selects that many leaves (visits are counted
+       on selection, acting as a virtual loss that spreads them out) and plays them out
+       in a process pool.
+    """
+    def __init__(self, eval_func, ant_eval_func, color=chess.WHITE, depth=1, parallelize=False,
+                 time_limit=None, node_limit=None, playouts=1000, exploration=1.4, use_priors=False,
+                 prior_temperature=1.0, rollout_plies=200, rollout_processes=None):
+        chess_agents.Agent.__init__(self, eval_func, ant_eval_func, color=color, depth=depth,
+                                    parallelize=parallelize, time_limit=time_limit, node_limit=node_limit)
+        self.playouts = playouts
+        self.exploration = exploration
+        self.use_priors = use_priors
+        self.prior_temperature = prior_temperature
+        self.rollout_plies = rollout_plies
+        self.rollout_processes = rollout_processes
+        self.pool = None
+
+        # the tree kept from the last move, and the length of the move stack at its root
+        self.root = None
+        self.root_plies = 0
+
+    def get_move(self, game_state, return_value=False):
+        board = game_state.board
+        if board.is_game_over() or not board.get_legal_moves():
+            return None
+
+        root = self.find_root(board)
+        start = time.time()
+        batch = self.rollout_processes or 1
+        done = 0
+        while True:
+            if self.time_limit is not None:
+                if done > 0 and time.time() - start >= self.time_limit:
+                    break
+            elif done >= self.playouts:
+                break
+            self.simulate(root, board, batch)
+            done += batch
+
+        best = max(root.children, key=lambda child: child.visits)
+        if return_value:
+            return (best.move, best.score / best.visits)
+        return best.move
+
+    def find_root(self, board):
+        """
+        The node for board in the kept tree, or a new root if the tree does not reach it.
+        """
+        stack = board.board.move_stack
+        node = self.root
+        if node is not None and len(stack) >= self.root_plies:
+            for mv in list(stack)[self.root_plies:]:
+                node = next((child for child in node.children if child.move == mv), None)
+                if node is None:
+                    break
+        if node is None or node.key != board.zobrist_hash:
+            node = Node(key=board.zobrist_hash)
+
+        node.parent = None
+        self.root = node
+        self.root_plies = len(stack)
+        return node
+
+    def simulate(self, root, board, batch):
+        """
+        Select batch leaves, play them out and back up the results.
+        """
+        leaves = []
+        for i in range(batch):
+            node, plies = self.select(root, board)
+            if self.rollout_processes:
+                leaves.append((node, board.fen()))
+            else:
+                self.backup(node, rollout(board, self.rollout_plies))
+            for j in range(plies):
+                board.pop()
+
+        if leaves:
+            tasks = [(fen, self.rollout_plies) for leaf, fen in leaves]
+            for (node, fen), winner in zip(leaves, self.rollout_pool().map(_rollout_task, tasks)):
+                self.backup(node, winner)
+
+    def select(self, root, board):
+        """
+        Walk down from root, pushing moves on board, to a new child of the first node
+        with an untried move, or to the end of the game. Visits are counted on the way.
+        Return the node reached and the number of moves pushed.
+        """
+        node = root
+        node.visits += 1
+        plies = 0
+        while not board.is_game_over():
+            if node.untried is None:
+                node.untried = self.untried_moves(board)
+
+            if node.untried:
+                mv, prior = node.untried.pop()
+                player = board.board.turn
+                board.push(mv)
+                child = Node(mv, node, player, board.zobrist_hash, prior)
+                node.children.append(child)
+                child.visits += 1
+                return child, plies + 1
+
+            if not node.children:
+                break
+            node = self.best_child(node)
+            board.push(node.move)
+            node.visits += 1
+            plies += 1
+
+        return node, plies
+
+    def untried_moves(self, board):
+        """
+        (move, prior) pairs for board, with the move to expand first last.
+        """
+        moves = board.get_legal_moves()
+        random.shuffle(moves)
+        if not self.use_priors or self.eval_func is None:
+            return [(mv, 1.0) for mv in moves]
+
+        player = board.board.turn
+        values = [v / self.prior_temperature for v in self.evaluate_moves(board, moves, player)]
+        top = max(values)
+        weights = [math.exp(v - top) for v in values]
+        total = sum(weights)
+        return sorted([(mv, w / total) for mv, w in zip(moves, weights)], key=lambda pair: pair[1])
+
+    def best_child(self, node):
+        """
+        The child maximizing UCB1, or PUCT when priors are used.
+        """
+        c = self.exploration
+        if self.use_priors:
+            root_n = math.sqrt(node.visits)
+            return max(node.children, key=lambda child: child.score / child.visits
+                                                        + c * child.prior * root_n / (1 + child.visits))
+        log_n = math.log(node.visits)
+        return max(node.children, key=lambda child: child.score / child.visits
+                                                    + c * math.sqrt(log_n / child.visits))
+
+    def backup(self, node, winner):
+        """
+        Add the result of a playout to node and its ancestors.
+        """
+        while node is not None:
+            if winner == 0.5:
+                node.score += 0.5
+            elif winner == node.player:
+                node.score += 1.0
+            node = node.parent
+
+    def rollout_pool(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.rollout_processes, worker_pool.init_worker_process)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
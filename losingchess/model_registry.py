@@ -0,0 +1,168 @@
+import accumulator
+import evaluation
+import quantize
+import vectorize
+
+import numpy as np
+import os
+import re
+
+"""
+Trained networks saved to disk, so that games can use a model without training it first.
+
+Each version of a model is one uncompressed .npz file in the registry directory, named
+<name>@<version>.npz. Besides the weights it records the kind of network, the name of
+the vectorize function it was trained on and the length of its feature vectors, so a
+model can be loaded, checked and scored without TensorFlow.
+"""
+
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pickles', 'models')
+
+# the evaluator for each kind of network, and the names of its weight arrays
+evaluators = {'softmax': evaluation.SoftmaxEval, 'multilayer': evaluation.MultilayerEval,
+              'td': evaluation.TDTrainEval, 'multilayer_int8': evaluation.QuantizedMultilayerEval}
+multilayer_weights = ['h1', 'h2', 'out']
+multilayer_biases = ['b1', 'b2', 'out']
+
+class StoredModel:
+    """
+    A model loaded from the registry, with the attributes the evaluators read from a
+    trained Softmax, Multilayer or TDLeafLambda model.
+    """
+    def __init__(self, name, version, kind, vectorize_method, W, b):
+        self.name = name
+        self.version = version
+        self.kind = kind
+        self.vectorize_method = vectorize_method
+        self.vector_len = vectorize.get_vector_len(vectorize_method)
+        self.n_input = self.vector_len
+        self.W = W
+        self.b = b
+
+    def trained(self):
+        return True
+
+def parse_spec(spec):
+    """
+    Split a model spec, 'name' or 'name@version', into (name, version). The version is
+    None when not given, meaning the latest.
+    """
+    name, _, version = spec.partition('@')
+    if not re.match(r'^[\w.-]+$', name):
+        raise ValueError('Invalid model name ' + name + '.')
+    if not version:
+        return name, None
+    if not version.isdigit():
+        raise ValueError('Invalid model version ' + version + '.')
+    return name, int(version)
+
+def path(name, version, directory=REGISTRY_DIR):
+    return os.path.join(directory, '%s@%d.npz' % (name, version))
+
+def versions(name, directory=REGISTRY_DIR):
+    """
+    The saved versions of name, in increasing order.
+    """
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile('^' + re.escape(name) + r'@(\d+)\.npz$')
+    return sorted(int(match.group(1)) for match in map(pattern.match, os.listdir(directory)) if match)
+
+def list_models(directory=REGISTRY_DIR):
+    """
+    (name, version) of every saved model, sorted.
+    """
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(r'^(.+)@(\d+)\.npz$')
+    return sorted((match.group(1), int(match.group(2)))
+                  for match in map(pattern.match, os.listdir(directory)) if match)
+
+def save(model, name, kind, version=None, directory=REGISTRY_DIR):
+    """
+    Save the trained weights of model (a Softmax, Multilayer or TDLeafLambda, a
+    StoredModel, or a quantize.QuantizedMultilayer of kind 'multilayer_int8') as name,
+    under the next free version unless one is given. Returns the version saved.
+    """
+    if kind not in evaluators:
+        raise Exception('Unknown model kind ' + kind + '.')
+    parse_spec(name)
+    if model.W is None or model.b is None:
+        raise Exception('Train model first.')
+
+    if kind == 'multilayer':
+        arrays = dict(('W_' + key, model.W[key]) for key in multilayer_weights)
+        arrays.update(('b_' + key, model.b[key]) for key in multilayer_biases)
+    elif kind == 'multilayer_int8':
+        arrays = dict(('Ws_' + key, model.w_scales[key]) for key in multilayer_weights)
+        arrays.update(('xs_' + key, model.x_scales[key]) for key in multilayer_weights)
+        arrays.update(('b_' + key, model.b[key]) for key in multilayer_biases)
+    else:
+        arrays = {'W': model.W, 'b': model.b}
+    arrays = dict((key, np.asarray(value, dtype=np.float32)) for key, value in arrays.items())
+    if kind == 'multilayer_int8':
+        # the quantized weights stay int8
+        arrays.update(('W_' + key, np.asarray(model.W[key], dtype=np.int8)) for key in multilayer_weights)
+
+    if version is None:
+        saved = versions(name, directory)
+        version = saved[-1] + 1 if saved else 1
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    np.savez(path(name, version, directory), kind=np.array(kind),
+             vectorizer=np.array(model.vectorize_method.__name__),
+             n_input=np.array(vectorize.get_vector_len(model.vectorize_method)), **arrays)
+    return version
+
+def load(spec, directory=REGISTRY_DIR):
+    """
+    The StoredModel, or QuantizedMultilayer, for spec, 'name' or 'name@version'.
+    """
+    name, version = parse_spec(spec)
+    if version is None:
+        saved = versions(name, directory)
+        if not saved:
+            raise Exception('No saved model named ' + name + '.')
+        version = saved[-1]
+
+    model_path = path(name, version, directory)
+    if not os.path.exists(model_path):
+        raise Exception('No saved model ' + name + '@' + str(version) + '.')
+
+    data = np.load(model_path)
+    try:
+        kind = str(data['kind'])
+        vectorize_method = getattr(vectorize, str(data['vectorizer']), None)
+        if vectorize_method is None:
+            raise Exception('Unknown vectorizer ' + str(data['vectorizer']) + '.')
+        if kind in ['multilayer', 'multilayer_int8']:
+            W = dict((key, data['W_' + key]) for key in multilayer_weights)
+            b = dict((key, data['b_' + key]) for key in multilayer_biases)
+        else:
+            W, b = data['W'], data['b']
+        if kind == 'multilayer_int8':
+            w_scales = dict((key, data['Ws_' + key]) for key in multilayer_weights)
+            x_scales = dict((key, data['xs_' + key]) for key in multilayer_weights)
+        n_input = int(data['n_input'])
+    finally:
+        data.close()
+
+    if kind == 'multilayer_int8':
+        model = quantize.QuantizedMultilayer(W, w_scales, b, x_scales, vectorize_method)
+    else:
+        model = StoredModel(name, version, kind, vectorize_method, W, b)
+    if vectorize.get_vector_len(vectorize_method) != n_input:
+        raise Exception('Model ' + spec + ' expects feature vectors of length ' + str(n_input) + '.')
+    return model
+
+def load_evaluator(spec, directory=REGISTRY_DIR, incremental=True):
+    """
+    An evaluator scoring boards with the saved model spec. Multilayer models on a
+    vectorization of single pieces are evaluated incrementally unless incremental is
+    False.
+    """
+    model = load(spec, directory)
+    if incremental and model.kind == 'multilayer' and accumulator.incremental(model.vectorize_method):
+        return evaluation.IncrementalMultilayerEval(model)
+    return evaluators[model.kind](model)
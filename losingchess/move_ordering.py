@@ -0,0 +1,103 @@
+import chess
+import evaluation
+
+# piece weights used to order captures, indexed by piece type
+ORDER_WEIGHTS = [0] + [evaluation.tuned_weights[piece_type] for piece_type in chess.PIECE_TYPES]
+
+# score bands: the hash move first, then killers, then captures and history
+HASH_MOVE_SCORE = 1 << 30
+KILLER_SCORES = [1 << 28, (1 << 28) - 1]
+CAPTURE_SCORE = 1 << 20
+
+# plies of killer slots kept
+MAX_PLY = 128
+
+class MoveOrderer:
+    """
+    Orders moves for alpha-beta search so that cutoffs come early.
+
+    -> The hash move from the transposition table is searched first.
+    -> Two killer moves per ply: quiet moves that recently caused a cutoff at that ply.
+    -> Captures are ordered by a losing chess victim/attacker heuristic: a capture is
+       better the heavier the capturing piece, which is then exposed to forced
+       recaptures, and the lighter the victim, which the opponent is glad to lose.
+    -> A history table [color][from square][to square] of cutoff counts, weighted by
+       depth, which persists across the moves of a game.
+    """
+    def __init__(self):
+        self.killers = [[None, None] for ply in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """
+        Prepare for the search of a new root position: killers refer to plies of the
+        old root and are dropped, while history is kept but aged.
+        """
+        for slots in self.killers:
+            slots[0] = slots[1] = None
+        for table in self.history:
+            for i in xrange(4096):
+                if table[i]:
+                    table[i] >>= 1
+
+    def order(self, board, moves, ply, hash_move=None):
+        """
+        Return moves sorted best first for the side to move on board (a LosingBoard).
+        """
+        chess_board = board.board
+        history = self.history[chess_board.turn]
+        killers = self.killers[ply] if ply < MAX_PLY else [None, None]
+        weights = ORDER_WEIGHTS
+
+        scored = []
+        for mv in moves:
+            if mv == hash_move:
+                score = HASH_MOVE_SCORE
+            elif mv == killers[0]:
+                score = KILLER_SCORES[0]
+            elif mv == killers[1]:
+                score = KILLER_SCORES[1]
+            else:
+                score = history[(mv.from_square << 6) | mv.to_square]
+                victim = chess_board.piece_type_at(mv.to_square)
+                if victim:
+                    attacker = chess_board.piece_type_at(mv.from_square)
+                    score += CAPTURE_SCORE + int(1000 * (weights[attacker] - weights[victim]))
+            scored.append((score, mv))
+
+        scored.sort(key=lambda t: t[0], reverse=True)
+        return [mv for move_score, mv in scored]
+
+    def record_cutoff(self, board, mv, ply, depth, move_index):
+        """
+        Note that mv, the move_index-th move searched at ply with depth to go, caused a
+        cutoff on board (before mv is made).
+        """
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+
+        chess_board = board.board
+        if chess_board.piece_type_at(mv.to_square):
+            return
+
+        # quiet moves become killers and gain history
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != mv:
+                killers[1] = killers[0]
+                killers[0] = mv
+        self.history[chess_board.turn][(mv.from_square << 6) | mv.to_square] += depth * depth
+
+    def stats(self):
+        """
+        Return cutoff counts and the fraction of cutoffs caused by the first move searched.
+        """
+        return {'cutoffs': self.cutoffs,
+                'first_move_cutoffs': self.first_move_cutoffs,
+                'first_move_rate': self.first_move_cutoffs / float(self.cutoffs) if self.cutoffs else 0.0}
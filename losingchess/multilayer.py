@@ -38,6 +38,12 @@ class Multilayer:
 
         # self.model_path = './pickles/model_2_layer.ckpt'
 
+    def trained(self):
+        """
+        Whether W and b hold trained weights, which train stores as numpy arrays.
+        """
+        return all(isinstance(w, np.ndarray) for w in self.W.values() + self.b.values())
+
     def multilayer_perceptron(self, x, weights, biases):
         """
         Constructs a multilayer neural network using TensorFlow
@@ -61,24 +67,14 @@ class Multilayer:
         print 'Training model - this could take a while...'
 
         # get vectorized, labeled training data
-        all_training_boards = parse.pgn_to_boards(self.num_data_sets, labels=True, vectorize_method=self.vectorize_method)
+        all_training_boards, labels = parse.pgn_to_arrays(self.num_data_sets, self.vectorize_method)
+        num_boards = len(all_training_boards)
 
         # confirm feature length
-        assert self.n_input == len(all_training_boards[0][0])
-
-        # encode label as one hot vector
-        for i, (board_vector, label) in enumerate(all_training_boards):
-            one_hot_vector = []
-            if label == 0:
-                one_hot_vector = [1,0,0]
-            elif label == 0.5:
-                one_hot_vector = [0,1,0]
-            elif label == 1:
-                one_hot_vector = [0,0,1]
-            else:
-                raise Exception('Invalid label.')
-
-            all_training_boards[i] = (all_training_boards[i][0], one_hot_vector)
+        assert self.n_input == all_training_boards.shape[1]
+
+        # encode labels as one hot vectors
+        all_labels = parse.one_hot(labels)
 
         # holders for training board vectors, and true labels
         x = tf.placeholder(tf.float32, [None, self.n_input])
@@ -100,10 +96,14 @@ class Multilayer:
             # run gradient descent number of times specified, using different randomly sampled
             # subset of boards each time
             for training_iteration in range(self.num_training_iterations):
-                training_boards = random.sample(all_training_boards, self.num_sample_positions)
-                x_train = [t[0] for t in training_boards]
-                y_train = np.array([t[1] for t in training_boards]).reshape(self.num_sample_positions, 3)
+                sample = random.sample(xrange(num_boards), self.num_sample_positions)
+                x_train = all_training_boards[sample]
+                y_train = all_labels[sample]
                 train_step.run(feed_dict={x: x_train, y_: y_train})
 
             # save_path = saver.save(sess, self.model_path)
             # print 'Model saved in file ' + save_path
+
+            # keep the trained weights as numpy arrays, for use without a session
+            self.W = dict((key, sess.run(value)) for key, value in self.W.items())
+            self.b = dict((key, sess.run(value)) for key, value in self.b.items())
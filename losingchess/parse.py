@@ -1,4 +1,7 @@
+import vectorize
+
 import chess.pgn
+import numpy as np
 import os
 
 def pgn_to_games(pgn_file):
@@ -25,10 +28,10 @@ def pgn_to_games(pgn_file):
     return games
 
 
-def pgn_to_boards(num_data_sets, labels=False, vectorize_method=None):
+def data_games(num_data_sets):
     """
-    Using pgn_to_games, returns a list of boards occurring in the games data.
-    num_data_sets should be <= 9, and .pgns must be in data directory.
+    Using pgn_to_games, returns the games of the first num_data_sets .pgns in the data
+    directory. num_data_sets should be <= 9.
     """
     num_data_sets = min(num_data_sets, 9)
 
@@ -42,19 +45,71 @@ def pgn_to_boards(num_data_sets, labels=False, vectorize_method=None):
     games = []
     for pgn_file in pgn_files:
         games += pgn_to_games(pgn_file)
-    
+    return games
+
+def game_result(game):
+    """
+    Result of game - 0.5 for draw, 1 for white win, 0 for white loss, None if unknown.
+    """
+    result_string = game.headers['Result']
+    if result_string == '1/2-1/2':
+        return 0.5
+    elif result_string == '1-0':
+        return 1
+    elif result_string == '0-1':
+        return 0
+    return None
+
+def pgn_to_arrays(num_data_sets, vectorize_method, chunk_size=4096):
+    """
+    The positions of pgn_to_boards, vectorized, as one N x F float32 array, with an
+    array of the N game results as labels. Positions are vectorized chunk_size at a
+    time with vectorize.vectorize_batch, playing through each game on a single board
+    rather than rebuilding one per position.
+    """
+    chunks = []
+    results = []
+    positions = []
+    for game in data_games(num_data_sets):
+        result = game_result(game)
+        if result is None:
+            continue
+
+        # move through all boards seen in game (except initial configuration)
+        board = game.board()
+        node = game
+        while not node.is_end():
+            node = node.variation(0)
+            board.push(node.move)
+            positions.append(board.copy(stack=False))
+            results.append(result)
+            if len(positions) == chunk_size:
+                chunks.append(vectorize.vectorize_batch(vectorize_method, positions))
+                positions = []
+
+    if positions or not chunks:
+        chunks.append(vectorize.vectorize_batch(vectorize_method, positions))
+    return np.concatenate(chunks), np.array(results, dtype=np.float32)
+
+def one_hot(labels):
+    """
+    Game results 0, 0.5 and 1 as rows [1,0,0], [0,1,0] and [0,0,1] of a float32 array.
+    """
+    labels = np.asarray(labels, dtype=np.float32)
+    if not np.all((labels == 0) | (labels == 0.5) | (labels == 1)):
+        raise Exception('Invalid label.')
+    return np.eye(3, dtype=np.float32)[(labels * 2).astype(int)]
+
+def pgn_to_boards(num_data_sets, labels=False, vectorize_method=None):
+    """
+    Using pgn_to_games, returns a list of boards occurring in the games data.
+    num_data_sets should be <= 9, and .pgns must be in data directory.
+    """
     board_result_pairs = []
-    for game in games:
+    for game in data_games(num_data_sets):
         # get result of game - 0.5 for draw, 1 for white win, 0 for white loss
-        result_string = game.headers['Result']
-        result = None
-        if result_string == '1/2-1/2':
-            result = 0.5
-        elif result_string == '1-0':
-            result = 1
-        elif result_string == '0-1':
-            result = 0
-        else:
+        result = game_result(game)
+        if result is None:
             continue
 
         # move through all boards seen in game (except initial configuration)
@@ -0,0 +1,134 @@
+import losing_board
+
+import sys
+import time
+
+"""
+Perft (performance test) for the losing chess move generator. Counts the leaf nodes
+of the full game tree to a fixed depth under LosingBoard rules, and checks them against
+reference counts, so that every move generation change is verified for both correctness
+and speed.
+
+Usage: python perft.py [max_depth]
+       python perft.py divide depth [fen]
+"""
+
+# reference leaf counts at depths 1, 2, 3, ... for each position, under losing chess
+# rules (forced captures including en passant, promotion to king, no castling)
+PERFT_SUITE = [
+    ('no_kings', None,
+     [21, 441, 9252, 183635, 3407972]),
+    ('standard', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8067, 153299, 2732672]),
+    ('castling_rights_ignored', 'r3k2r/pppppppp/8/8/8/8/PPPPPPPP/R3K2R w KQkq - 0 1',
+     [23, 529, 11717, 259183]),
+    ('forced_en_passant', 'rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR w - d6 0 3',
+     [1, 3, 87, 1483]),
+    ('en_passant_choice', '8/8/8/8/3pPp2/8/8/R7 b - e3 0 1',
+     [2, 28, 56, 602, 2214]),
+    ('en_passant_only_move', '4k3/8/8/2pPp3/8/8/8/R3K3 w - c6 0 1',
+     [1, 6, 81, 572, 8591]),
+    ('promotion_to_king', 'n7/1P4k1/8/8/8/8/6p1/K6N w - - 0 1',
+     [5, 25, 145, 1005, 10671]),
+    ('quiet_promotions', '8/P6p/8/8/8/8/p6P/8 w - - 0 1',
+     [7, 49, 223, 1335, 10119]),
+    ('only_captures', 'rnbqkbnr/p1pppppp/8/1p6/4P3/8/PPPP1PPP/RNBQKBNR w - b6 0 2',
+     [1, 20, 26, 97]),
+    ('capture_cascade', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w - - 0 1',
+     [8, 62, 487]),
+]
+
+def make_board(fen):
+    """
+    LosingBoard for a suite entry; a fen of None is the no_kings start.
+    """
+    if fen is None:
+        return losing_board.LosingBoard(no_kings=True)
+    return losing_board.LosingBoard(b_fen=fen)
+
+def perft(board, depth):
+    """
+    Return the number of leaf nodes depth plies below board.
+    The board is walked with push/pop and left unchanged.
+    """
+    moves = board.get_legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    nodes = 0
+    for mv in moves:
+        board.push(mv)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+def divide(board, depth):
+    """
+    Return a dict from each root move's uci string to its perft count at depth - 1.
+    """
+    counts = {}
+    for mv in board.get_legal_moves():
+        board.push(mv)
+        counts[mv.uci()] = perft(board, depth - 1)
+        board.pop()
+    return counts
+
+def run_suite(max_depth=3, verbose=True):
+    """
+    Run perft on every suite position up to max_depth, checking against the reference
+    counts and reporting nodes/sec. Return True if every count matches.
+    """
+    all_passed = True
+    total_nodes = 0
+    total_time = 0.0
+
+    for name, fen, expected in PERFT_SUITE:
+        board = make_board(fen)
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            start = time.time()
+            nodes = perft(board, depth)
+            elapsed = time.time() - start
+
+            total_nodes += nodes
+            total_time += elapsed
+            passed = nodes == expected[depth - 1]
+            all_passed = all_passed and passed
+
+            if verbose:
+                nps = nodes / elapsed if elapsed > 0 else float('inf')
+                print '%-24s depth %d: %9d nodes %9.0f nodes/sec %s' % \
+                      (name, depth, nodes, nps, 'ok' if passed else 'FAILED, expected ' + str(expected[depth - 1]))
+
+    if verbose:
+        print
+        print 'Total: ' + str(total_nodes) + ' nodes in ' + str(round(total_time, 3)) + ' sec (' \
+              + str(int(total_nodes / total_time if total_time > 0 else 0)) + ' nodes/sec)'
+        print 'All counts match.' if all_passed else 'MISMATCHED COUNTS.'
+
+    return all_passed
+
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    if args and args[0] == 'divide':
+        if len(args) < 2:
+            print 'Usage: python perft.py divide depth [fen]'
+            sys.exit()
+        depth = int(args[1])
+        board = make_board(' '.join(args[2:]) or None)
+
+        start = time.time()
+        counts = divide(board, depth)
+        elapsed = time.time() - start
+
+        for uci in sorted(counts):
+            print uci + ': ' + str(counts[uci])
+        nodes = sum(counts.values())
+        print
+        print 'Moves: ' + str(len(counts))
+        print 'Nodes: ' + str(nodes) + ' (' + str(int(nodes / elapsed if elapsed > 0 else 0)) + ' nodes/sec)'
+    else:
+        max_depth = int(args[0]) if args else 3
+        if not run_suite(max_depth):
+            sys.exit(1)
@@ -1,65 +1,90 @@
 import losing_board
 import game
 import evaluation
+import model_registry
+import quantize
 import chess
-import softmax
-import multilayer
-import td_lambda
 import time
 from copy import deepcopy
 
-def play_game(agent_1, eval_func_1, depth_1, agent_2, eval_func_2, depth_2, td_parameters, softmax_parameters, multilayer_parameters, board=losing_board.LosingBoard(no_kings=False)):
+def make_evaluator(eval_func, cache_entries=None):
     """
-    Plays the specified game, printing progress, results and game duration to screen.
+    The Evaluator for eval_func: an Evaluator class, a saved model spec ('name' or
+    'name@version', see model_registry), or None. Saved models are wrapped in a cache
+    of cache_entries values, if given; the heuristic evaluators are cheaper to call
+    than to look up.
     """
-    # agent 1 evaluator
-    if eval_func_1 == evaluation.SoftmaxEval:
-        model = softmax.Softmax(*softmax_parameters)
-        model.train()
-        evaluator_1 = evaluation.SoftmaxEval(model).evaluate
+    if eval_func is None:
+        return None
+    elif isinstance(eval_func, str):
+        evaluator = model_registry.load_evaluator(eval_func)
+        if cache_entries:
+            evaluator = evaluation.cache_evaluator(evaluator, cache_entries)
+        return evaluator
+    else:
+        return eval_func()
 
-    elif eval_func_1 == evaluation.MultilayerEval:
+def train_model(kind, name, td_parameters, softmax_parameters, multilayer_parameters):
+    """
+    Train a network of the given kind ('softmax', 'multilayer' or 'td') and save it
+    in the model registry as name. Returns the version saved.
+    """
+    # the training modules import TensorFlow, which playing does not need
+    if kind == 'softmax':
+        import softmax
+        model = softmax.Softmax(*softmax_parameters)
+    elif kind == 'multilayer':
+        import multilayer
         model = multilayer.Multilayer(*multilayer_parameters)
-        model.train()
-        evaluator_1 = evaluation.MultilayerEval(model).evaluate
-
-    elif eval_func_1 == evaluation.TDTrainEval:
+    elif kind == 'td':
+        import td_lambda
         model = td_lambda.TDLeafLambda(*td_parameters)
-        model.train()
-        evaluator_1 = evaluation.TDTrainEval(model).evaluate
-
-    elif eval_func_1 is None:
-        evaluator_1 = None
-
     else:
-        evaluator_1 = eval_func_1().evaluate
+        raise Exception('Unknown model kind ' + kind + '.')
 
-    # agent 2 evaluator
-    if eval_func_2 == evaluation.SoftmaxEval:
-        model = softmax.Softmax(*softmax_parameters)
-        model.train()
-        evaluator_2 = evaluation.SoftmaxEval(model).evaluate
+    model.train()
+    return model_registry.save(model, name, kind)
 
-    elif eval_func_2 == evaluation.MultilayerEval:
-        model = multilayer.Multilayer(*multilayer_parameters)
-        model.train()
-        evaluator_2 = evaluation.MultilayerEval(model).evaluate
+def quantize_model(spec, num_data_sets=1):
+    """
+    Quantize the saved multilayer model spec to int8, calibrating it on positions from
+    the FICS games and reporting its agreement with the float model on positions held
+    out from calibration. The result is saved as <name>_int8; returns its spec.
+    """
+    model = model_registry.load(spec)
+    if model.kind != 'multilayer':
+        raise Exception('Only multilayer models can be quantized.')
 
-    elif eval_func_2 == evaluation.TDTrainEval:
-        model = td_lambda.TDLeafLambda(*td_parameters)
-        model.train()
-        evaluator_2 = evaluation.TDTrainEval(model).evaluate
+    calibration, held_out = quantize.fics_vectors(model.vectorize_method, num_data_sets)
+    quantized = quantize.quantize(model, calibration)
+    check = quantize.agreement(model, quantized, held_out)
+    print 'Agreement with the float model on ' + str(len(held_out)) + ' held-out positions:'
+    print 'same most likely result: %.2f%%' % (100 * check['argmax'])
+    print 'value error: %.4f mean, %.4f max' % (check['mean_error'], check['max_error'])
 
-    elif eval_func_2 is None:
-        evaluator_2 = None
+    name = model.name + '_int8'
+    return name + '@' + str(model_registry.save(quantized, name, quantize.QuantizedMultilayer.kind))
 
+def play_game(agent_1, eval_func_1, depth_1, agent_2, eval_func_2, depth_2, board=losing_board.LosingBoard(no_kings=False),
+              time_limit_1=None, time_limit_2=None, cache_entries=100000):
+    """
+    Plays the specified game, printing progress, results and game duration to screen.
+    An agent given a time limit (seconds per move) deepens iteratively instead of
+    searching to its fixed depth. Evaluators are given as for make_evaluator; learned
+    models are loaded from the registry rather than trained, and agents using the same
+    one share its evaluation cache.
+    """
+    evaluator_1 = make_evaluator(eval_func_1, cache_entries)
+    if eval_func_2 == eval_func_1:
+        evaluator_2 = evaluator_1
     else:
-        evaluator_2 = eval_func_2().evaluate
-
+        evaluator_2 = make_evaluator(eval_func_2, cache_entries)
+    evaluate_1 = evaluator_1.evaluate if evaluator_1 is not None else None
+    evaluate_2 = evaluator_2.evaluate if evaluator_2 is not None else None
 
     # construct final agents, and gament_2(color=chess.BLACK, eval_func=evaluator_2, depth=depth_2, ant_eval_func=evaluator_1)
-    a1 = agent_1(color=chess.WHITE, eval_func=evaluator_1, ant_eval_func = evaluator_2, depth=depth_1)
-    a2 = agent_2(color=chess.BLACK, eval_func=evaluator_2, ant_eval_func = evaluator_1, depth=depth_2)
+    a1 = agent_1(color=chess.WHITE, eval_func=evaluate_1, ant_eval_func = evaluate_2, depth=depth_1, time_limit=time_limit_1)
+    a2 = agent_2(color=chess.BLACK, eval_func=evaluate_2, ant_eval_func = evaluate_1, depth=depth_2, time_limit=time_limit_2)
  
     game_to_play = game.Game(board, a1, a2)
 
@@ -69,3 +94,7 @@ def play_game(agent_1, eval_func_1, depth_1, agent_2, eval_func_2, depth_2, td_p
     end = time.time()
     print 'Game time:', (end - start)
 
+    caches = [evaluator_1] if evaluator_2 is evaluator_1 else [evaluator_1, evaluator_2]
+    for evaluator in caches:
+        if isinstance(evaluator, evaluation.CachedEvaluator):
+            print 'Evaluation cache:', evaluator
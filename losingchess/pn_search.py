@@ -0,0 +1,255 @@
+import chess
+import chess_agents
+
+import shelve
+import struct
+import sys
+
+"""
+Depth-first proof-number search (df-pn) for forced wins in losing chess.
+
+The solver tries to prove that a given player (the attacker) can force a win from a
+LosingBoard, or to disprove it. Each position carries a proof number, the least number
+of positions still to be solved to prove the win, and a disproof number, the same for
+disproving it. Search always descends towards the position that is cheapest to settle,
+so the narrow lines made by forced captures get solved first.
+"""
+
+# proof and disproof numbers of a solved position
+INFINITY = 10 ** 9
+
+# memory taken by a table entry, in bytes, measured on an unsolved entry: its key (a
+# 65-bit long), its (proof, disproof) tuple and numbers, and its dict slot of three
+# words, kept at most two thirds full
+ENTRY_BYTES = (sys.getsizeof(1 << 64) + sys.getsizeof((INFINITY, INFINITY)) + 2 * sys.getsizeof(INFINITY)
+               + 3 * struct.calcsize('P') * 3 // 2)
+
+class SolverBudget(Exception):
+    """
+    Raised inside the solver when its node budget runs out.
+    """
+    pass
+
+class ProofNumberSearch:
+    """
+    df-pn solver with a transposition table of (proof, disproof) numbers, keyed by
+    position and attacker.
+
+    -> A finished game is a win for the player with fewer pieces, as decided by
+       LosingBoard.winner_by_pieces; this covers both is_game_over and a player left
+       without moves. Draws count as failures for the attacker.
+    -> A position repeated on the current line, or more than max_plies from the
+       root, counts as a failure for the attacker. This keeps proofs sound, but a
+       disproof may depend on the line it was found on.
+    -> The table holds at most table_mb of entries; when it is full, unsolved entries
+       are dropped.
+    -> With a proof_file, proven positions are also kept on disk in a shelve and read
+       back by later runs.
+    """
+    def __init__(self, node_limit=100000, table_mb=64, max_plies=200, proof_file=None):
+        self.node_limit = node_limit
+        self.max_entries = table_mb * 2 ** 20 // ENTRY_BYTES
+        self.max_plies = max_plies
+        self.table = {}
+        self.proof_file = proof_file
+        self.disk = None
+        self.nodes = 0
+
+    def close(self):
+        # the shelve is reopened on next use, so a solver can outlive a game
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+    def proof_disk(self):
+        """
+        The shelve of proven positions, opened on first use; None without a proof_file.
+        """
+        if self.disk is None and self.proof_file:
+            self.disk = shelve.open(self.proof_file)
+        return self.disk
+
+    def solve(self, board, attacker=None):
+        """
+        Try to settle whether attacker (by default the side to move) can force a win
+        from board. Return (True, proving move) if proven, (False, None) if disproven,
+        and (None, None) if the node budget ran out first. The proving move is None if
+        it is the opponent to move. The board is left unchanged.
+        """
+        if attacker is None:
+            attacker = board.board.turn
+        self.attacker = attacker
+        self.nodes = 0
+        self.path = set()
+
+        key = self.key(board)
+        pn, dn = self.lookup(key)
+        if pn != 0 and dn != 0:
+            result = self.terminal(board)
+            if result is not None:
+                pn, dn = result
+                self.save(key, pn, dn)
+            else:
+                try:
+                    pn, dn = self.mid(board, key, INFINITY, INFINITY, 0)
+                except SolverBudget:
+                    return None, None
+                self.save(key, pn, dn)
+
+        if pn == 0:
+            return True, self.proving_move(board)
+        elif dn == 0:
+            return False, None
+        return None, None
+
+    def proving_move(self, board):
+        """
+        The attacker's move to a proven position, if the attacker is to move.
+        """
+        if board.board.turn != self.attacker:
+            return None
+        for mv in board.get_legal_moves():
+            board.push(mv)
+            key = self.key(board)
+            board.pop()
+            if self.lookup(key)[0] == 0:
+                return mv
+        return None
+
+    def key(self, board):
+        # proofs hold for one attacker, so the attacker is part of the key
+        return (board.zobrist_hash << 1) | self.attacker
+
+    def lookup(self, key):
+        """
+        (proof, disproof) numbers of key, (1, 1) if it has not been searched.
+        """
+        entry = self.table.get(key)
+        if entry is not None:
+            return entry
+        disk = self.proof_disk()
+        if disk is not None:
+            entry = disk.get('%x' % key)
+            if entry is not None:
+                self.table[key] = entry
+                return entry
+        return 1, 1
+
+    def save(self, key, pn, dn):
+        if len(self.table) >= self.max_entries:
+            self.collect()
+        self.table[key] = (pn, dn)
+        if pn == 0 and self.proof_disk() is not None:
+            self.disk['%x' % key] = (pn, dn)
+
+    def collect(self):
+        """
+        Drop the unsolved entries of a full table.
+        """
+        self.table = dict((key, entry) for key, entry in self.table.iteritems() if entry[0] == 0 or entry[1] == 0)
+
+    def terminal(self, board):
+        """
+        (proof, disproof) numbers of a finished game, or None if it goes on.
+        """
+        if not board.is_game_over() and board.get_legal_moves():
+            return None
+        if board.winner_by_pieces() == self.attacker:
+            return 0, INFINITY
+        return INFINITY, 0
+
+    def mid(self, board, key, th_pn, th_dn, ply):
+        """
+        Search board until its proof number reaches th_pn or its disproof number
+        reaches th_dn, and return its (proof, disproof) numbers.
+        """
+        self.nodes += 1
+        if self.nodes > self.node_limit:
+            raise SolverBudget()
+
+        # child positions, each entered in the table on first sight
+        children = []
+        repeated = set()
+        for mv in board.get_legal_moves():
+            board.push(mv)
+            child = self.key(board)
+            if child in self.path or ply + 1 >= self.max_plies:
+                repeated.add(child)
+            elif child not in self.table and self.lookup(child) == (1, 1):
+                self.save(child, *(self.terminal(board) or (1, 1)))
+            board.pop()
+            children.append((mv, child))
+
+        attacker_to_move = board.board.turn == self.attacker
+        self.path.add(key)
+        try:
+            while True:
+                numbers = [(INFINITY, 0) if child_key in repeated else self.lookup(child_key) for mv, child_key in children]
+                if attacker_to_move:
+                    pn = min(p for p, d in numbers)
+                    dn = min(INFINITY, sum(d for p, d in numbers))
+                else:
+                    pn = min(INFINITY, sum(p for p, d in numbers))
+                    dn = min(d for p, d in numbers)
+                if pn >= th_pn or dn >= th_dn:
+                    break
+
+                # descend into the child closest to settling this position
+                if attacker_to_move:
+                    order = sorted(range(len(numbers)), key=lambda i: numbers[i][0])
+                    best = order[0]
+                    second = numbers[order[1]][0] if len(order) > 1 else INFINITY
+                    child_th_pn = min(th_pn, second + 1)
+                    child_th_dn = th_dn - dn + numbers[best][1]
+                else:
+                    order = sorted(range(len(numbers)), key=lambda i: numbers[i][1])
+                    best = order[0]
+                    second = numbers[order[1]][1] if len(order) > 1 else INFINITY
+                    child_th_pn = th_pn - pn + numbers[best][0]
+                    child_th_dn = min(th_dn, second + 1)
+
+                mv, child = children[best]
+                board.push(mv)
+                try:
+                    child_pn, child_dn = self.mid(board, child, min(child_th_pn, INFINITY), min(child_th_dn, INFINITY), ply + 1)
+                finally:
+                    board.pop()
+                self.save(child, child_pn, child_dn)
+        finally:
+            self.path.discard(key)
+
+        return pn, dn
+
+class ProofNumberAgent(chess_agents.Agent):
+    """
+    Agent that plays a proven forced win when the solver finds one within its node
+    budget, and otherwise plays the move of an AlphaBetaAgent with the same evaluator,
+    depth and time limit.
+    """
+    def __init__(self, eval_func, ant_eval_func, color=chess.WHITE, depth=1, parallelize=False,
+                 time_limit=None, node_limit=None, solver_nodes=10000, table_mb=64, proof_file=None):
+        chess_agents.Agent.__init__(self, eval_func, ant_eval_func, color=color, depth=depth,
+                                    parallelize=parallelize, time_limit=time_limit, node_limit=node_limit)
+        self.solver = ProofNumberSearch(node_limit=solver_nodes, table_mb=table_mb, proof_file=proof_file)
+        self.fallback = chess_agents.AlphaBetaAgent(eval_func, ant_eval_func, color=color, depth=depth,
+                                                    parallelize=parallelize, time_limit=time_limit,
+                                                    node_limit=node_limit)
+
+    def get_move(self, game_state, return_value=False):
+        board = game_state.board
+        if not board.get_legal_moves():
+            return None
+
+        proven, mv = self.solver.solve(board, self.color)
+        if proven and mv is not None:
+            if return_value:
+                return (mv, chess_agents.WIN_VALUE)
+            return mv
+
+        # the time limit may have been set on this agent after it was made
+        self.fallback.time_limit = self.time_limit
+        return self.fallback.get_move(game_state, return_value)
+
+    def close(self):
+        self.fallback.close()
+        self.solver.close()
@@ -0,0 +1,149 @@
+import inference
+import parse
+
+import numpy as np
+
+"""
+int8 quantization of trained Multilayer networks.
+
+Weights are quantized per output unit: each column of a weight matrix gets its own
+scale, so that its largest weight maps to 127. The input of each layer is quantized
+with one scale per layer, found by calibration: the largest value it takes over a set
+of positions. A layer then multiplies int8 inputs by int8 weights, sums the products
+in int32, and scales the sums back to floats before adding the bias; the relus and
+the final softmax work on floats, as in the float network.
+
+NumPy has no int8 matrix product, and its integer products are much slower than its
+float32 ones. The int32 sums are therefore computed as float32 products of the integer
+values, which give exactly the same sums as long as they stay below 2 ** 24; for layers
+too wide for that, the sums are computed in int32.
+"""
+
+# largest magnitude of a quantized value
+QMAX = 127
+
+# the largest int32 sum a float32 product is guaranteed to compute exactly
+EXACT_SUM = 2 ** 24
+
+# keys of the weight and bias dicts of a Multilayer, layer by layer
+weight_keys = ['h1', 'h2', 'out']
+bias_keys = ['b1', 'b2', 'out']
+
+def quantize_weights(W):
+    """
+    (int8 weights, float32 scale per column) for weight matrix W.
+    """
+    W = np.asarray(W, dtype=np.float32)
+    scales = np.abs(W).max(axis=0) / QMAX
+    scales[scales == 0] = 1.0
+    return np.round(W / scales).astype(np.int8), scales.astype(np.float32)
+
+def quantize_inputs(x, scale):
+    """
+    x quantized to integers in [-QMAX, QMAX] with scale, as float32 values.
+    """
+    q = np.round(x / scale)
+    np.clip(q, -QMAX, QMAX, out=q)
+    return q.astype(np.float32)
+
+class QuantizedMultilayer:
+    """
+    A Multilayer network with int8 weights. W holds the int8 weight matrices and
+    w_scales their column scales, keyed like Multilayer.W; b holds the float32 biases,
+    keyed like Multilayer.b; x_scales holds the input scale of each layer, keyed like W.
+    """
+    kind = 'multilayer_int8'
+
+    def __init__(self, W, w_scales, b, x_scales, vectorize_method):
+        self.W = dict((key, np.asarray(W[key], dtype=np.int8)) for key in weight_keys)
+        self.w_scales = dict((key, np.asarray(w_scales[key], dtype=np.float32)) for key in weight_keys)
+        self.b = dict((key, np.asarray(b[key], dtype=np.float32)) for key in bias_keys)
+        self.x_scales = dict((key, float(x_scales[key])) for key in weight_keys)
+        self.vectorize_method = vectorize_method
+        self.n_input = self.W['h1'].shape[0]
+        self.vector_len = self.n_input
+
+        # the integer weights as float32, for exact products on layers narrow enough
+        self.exact = dict((key, self.W[key].shape[0] * QMAX * QMAX < EXACT_SUM) for key in weight_keys)
+        self.products = dict((key, self.W[key].astype(np.float32 if self.exact[key] else np.int32))
+                             for key in weight_keys)
+
+    def trained(self):
+        return True
+
+    def layer(self, x, key, bias_key):
+        """
+        Layer key of the network for float inputs x: quantize, multiply and sum in
+        integers, then scale back and add the bias.
+        """
+        x_scale = self.x_scales[key]
+        q = quantize_inputs(x, x_scale)
+        if self.exact[key]:
+            sums = np.dot(q, self.products[key])
+        else:
+            sums = np.dot(q.astype(np.int32), self.products[key]).astype(np.float32)
+        sums *= x_scale * self.w_scales[key]
+        sums += self.b[bias_key]
+        return sums
+
+    def forward(self, vectors):
+        """
+        Likelihoods of losing, drawing and winning for a batch of feature vectors.
+        """
+        x = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        layer_1 = np.maximum(self.layer(x, 'h1', 'b1'), 0)
+        layer_2 = np.maximum(self.layer(layer_1, 'h2', 'b2'), 0)
+        return inference.softmax(self.layer(layer_2, 'out', 'out'))
+
+def calibrate(model, vectors):
+    """
+    The input scale of each layer of model (a trained Multilayer or a saved one), the
+    largest magnitude the layer's input takes over vectors, divided by QMAX.
+    """
+    W = dict((key, np.asarray(model.W[key], dtype=np.float32)) for key in weight_keys)
+    b = dict((key, np.asarray(model.b[key], dtype=np.float32)) for key in bias_keys)
+
+    x = np.asarray(vectors, dtype=np.float32)
+    layer_1 = np.maximum(x.dot(W['h1']) + b['b1'], 0)
+    layer_2 = np.maximum(layer_1.dot(W['h2']) + b['b2'], 0)
+
+    scales = {}
+    for key, inputs in zip(weight_keys, [x, layer_1, layer_2]):
+        top = float(np.abs(inputs).max()) if inputs.size else 0.0
+        scales[key] = top / QMAX if top > 0 else 1.0
+    return scales
+
+def quantize(model, calibration_vectors):
+    """
+    QuantizedMultilayer for model, calibrated on calibration_vectors.
+    """
+    W, w_scales = {}, {}
+    for key in weight_keys:
+        W[key], w_scales[key] = quantize_weights(model.W[key])
+    return QuantizedMultilayer(W, w_scales, model.b, calibrate(model, calibration_vectors), model.vectorize_method)
+
+def agreement(model, quantized, vectors):
+    """
+    Compare quantized with the float network of model on vectors. Returns a dict with
+    the fraction of vectors given the same most likely result ('argmax'), and the
+    largest and mean absolute difference of the values MultilayerEval gives white,
+    preds[:, 0] - preds[:, 2] ('max_error' and 'mean_error').
+    """
+    float_net = inference.MultilayerNet(model.W, model.b)
+    float_preds = float_net.forward(vectors).copy()
+    quantized_preds = quantized.forward(vectors)
+
+    errors = np.abs((float_preds[:, 0] - float_preds[:, 2]) - (quantized_preds[:, 0] - quantized_preds[:, 2]))
+    return {'argmax': float(np.mean(np.argmax(float_preds, 1) == np.argmax(quantized_preds, 1))),
+            'max_error': float(errors.max()), 'mean_error': float(errors.mean())}
+
+def fics_vectors(vectorize_method, num_data_sets=1, held_out=0.2, max_positions=20000):
+    """
+    Positions from the FICS games in data/, vectorized, shuffled and split into
+    (calibration vectors, held-out vectors), with at most max_positions in all.
+    """
+    vectors, labels = parse.pgn_to_arrays(num_data_sets, vectorize_method)
+    np.random.shuffle(vectors)
+    vectors = vectors[:max_positions]
+    split = int(len(vectors) * (1 - held_out))
+    return vectors[:split], vectors[split:]
@@ -2,7 +2,6 @@ import parse
 import vectorize
 
 import random
-import numpy as np
 import tensorflow as tf
 
 class Softmax:
@@ -24,23 +23,12 @@ class Softmax:
 
     def train(self, print_accuracy=False):
         # get vectorized, labeled training data
-        all_training_boards = parse.pgn_to_boards(self.num_data_sets, labels=True, vectorize_method=self.vectorize_method)
+        all_training_boards, labels = parse.pgn_to_arrays(self.num_data_sets, self.vectorize_method)
         num_boards = len(all_training_boards)
-        assert self.vector_len == len(all_training_boards[0][0])
+        assert self.vector_len == all_training_boards.shape[1]
 
-        # encode label as one hot vector
-        for i, (board_vector, label) in enumerate(all_training_boards):
-            one_hot_vector = []
-            if label == 0:
-                one_hot_vector = [1,0,0]
-            elif label == 0.5:
-                one_hot_vector = [0,1,0]
-            elif label == 1:
-                one_hot_vector = [0,0,1]
-            else:
-                raise Exception('Invalid label.')
-
-            all_training_boards[i] = (all_training_boards[i][0], one_hot_vector)
+        # encode labels as one hot vectors
+        all_labels = parse.one_hot(labels)
 
         # holders for training board vectors, and true labels
         x = tf.placeholder(tf.float32, [None, self.vector_len])
@@ -64,18 +52,16 @@ class Softmax:
             # run gradient descent number of times specified, using different randomly sampled
             # subset of boards each time
             for training_iteration in range(self.num_training_iterations):
-                training_boards = random.sample(all_training_boards, self.num_sample_positions)
-                x_train = [t[0] for t in training_boards]
-                y_train = np.array([t[1] for t in training_boards]).reshape(self.num_sample_positions, 3)
+                sample = random.sample(xrange(num_boards), self.num_sample_positions)
+                x_train = all_training_boards[sample]
+                y_train = all_labels[sample]
                 train_step.run(feed_dict={x: x_train, y_: y_train})
 
             if print_accuracy:
                 # evaluate accuracy on whole training set (not reliable because train set = test set)
                 correct_prediction = tf.equal(tf.argmax(y,1), tf.argmax(y_,1))
                 accuracy = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
-                x_all = [t[0] for t in all_training_boards]
-                y_all = np.array([t[1] for t in all_training_boards]).reshape(num_boards, 3)
-                print(sess.run(accuracy, feed_dict={x: x_all, y_: y_all}))
+                print(sess.run(accuracy, feed_dict={x: all_training_boards, y_: all_labels}))
 
             # convert evaluated tensors to np arrays
             self.W = W.eval()
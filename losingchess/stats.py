@@ -24,6 +24,13 @@ class StatsGenerator:
 		recording the results of each game.
 		"""
 		a1_victory_history = []
+		# total seconds thinking and moves made, for a1 and a2
+		self.think_time = {a1: 0.0, a2: 0.0}
+		self.moves_made = {a1: 0, a2: 0}
+		for agent in [a1, a2]:
+			evaluator = self.evaluator(agent)
+			if hasattr(evaluator, 'reset_counts'):
+				evaluator.reset_counts()
 
 		for i in range(self.max_iter):
 			tmp_board = deepcopy(board)
@@ -34,6 +41,9 @@ class StatsGenerator:
 			else:
 				g = game.Game(tmp_board, a2, a1, get_stats=True)
 				winning_agent = g.play(max_turns=200)
+			for agent, seconds, moves in zip([g.a1, g.a2], g.think_time, g.moves_made):
+				self.think_time[agent] += seconds
+				self.moves_made[agent] += moves
 			if winning_agent == chess.WHITE:
 				a1_victory_history.append(True)
 			else:
@@ -63,10 +73,17 @@ class StatsGenerator:
 			p = 1 - p
 
 		print
-		print win_agent.__class__.__name__ + " with evaluator '" + str(win_agent.eval_func.im_class)[11:] + "' and depth " + str(win_agent.depth)
+		print self.describe_agent(win_agent)
 		print "wins " + str(sum(history)) + " out of " + str(len(history)) + " games against"
-		print lose_agent.__class__.__name__ + " with evaluator '" + str(lose_agent.eval_func.im_class)[11:] + "' and depth " + str(lose_agent.depth)
+		print self.describe_agent(lose_agent)
 		print "p-value: " + str(p)
+		print "seconds per move: " + str(self.seconds_per_move(win_agent)) + " (winner), " \
+			+ str(self.seconds_per_move(lose_agent)) + " (loser)"
+		for agent in [win_agent, lose_agent]:
+			evaluator = self.evaluator(agent)
+			if hasattr(evaluator, 'cheap_only'):
+				print "cheap-only and full evaluations of " + self.describe_agent(agent) + ": " \
+					+ str(evaluator.cheap_only) + ", " + str(evaluator.full)
 		print
 		if p > self.sig_level:
 			print "No significant difference found."
@@ -74,6 +91,23 @@ class StatsGenerator:
 		print
 		return
 
+	def seconds_per_move(self, agent):
+
+		if not self.moves_made[agent]:
+			return 0.0
+		return round(self.think_time[agent] / self.moves_made[agent], 3)
+
+	def evaluator(self, agent):
+
+		return getattr(agent.eval_func, 'im_self', None)
+
+	def describe_agent(self, agent):
+
+		description = agent.__class__.__name__ + " with evaluator '" + str(agent.eval_func.im_class)[11:] + "' and depth " + str(agent.depth)
+		if getattr(agent, 'quiescence', False):
+			description += " and quiescence"
+		return description
+
 
 if __name__ == "__main__":
 
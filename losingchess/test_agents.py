@@ -0,0 +1,74 @@
+import chess_agents
+import evaluation
+import game
+import losing_board
+
+import chess
+
+import random
+import unittest
+
+"""
+Regression tests for the search agents.
+
+Usage: python -m unittest test_agents
+"""
+
+def random_positions(count, plies=12, seed=0):
+    """
+    Boards reached by count random games of up to plies moves from the no_kings start.
+    """
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = losing_board.LosingBoard(no_kings=True)
+        for i in range(plies):
+            moves = board.get_legal_moves()
+            if board.is_game_over() or not moves:
+                break
+            board.push(rng.choice(moves))
+        if not board.is_game_over() and board.get_legal_moves():
+            boards.append(board)
+    return boards
+
+class ExpectimaxTest(unittest.TestCase):
+
+    def test_low_opponent_temperature(self):
+        # at a low temperature the softmax sends most opponent moves to probability 0
+        counter = evaluation.WeightedPieceCountWCaptures()
+        for board in random_positions(10):
+            agent = chess_agents.ExpectimaxAgent(counter.evaluate, counter.evaluate, color=board.board.turn,
+                                                 depth=2, value_range=(-40.0, 40.0), model_opponent=True,
+                                                 opponent_temperature=0.01)
+            mv = agent.get_move(game.Game(board, agent, None))
+            self.assertIn(mv, board.get_legal_moves())
+
+# white's e5d6 en passant capture is legal in losing chess, but not in standard chess,
+# where it leaves the white king on c5 attacked by the queen on c2
+EP_FEN = '8/4P2p/1N6/2KpP3/8/4n3/2qN4/8 w - d6 0 1'
+
+class ParallelSearchTest(unittest.TestCase):
+
+    def test_fen_keeps_en_passant(self):
+        board = losing_board.LosingBoard(b_fen=EP_FEN)
+        rebuilt = losing_board.LosingBoard(b_fen=board.fen())
+        self.assertEqual(rebuilt.get_legal_moves(), board.get_legal_moves())
+        rebuilt.push(chess.Move.from_uci('e5d6'))
+        self.assertIsNone(rebuilt.board.piece_at(chess.D5))
+
+    def test_root_search_matches_serial(self):
+        counter = evaluation.WeightedPieceCount()
+        values = []
+        for parallelize in (False, True):
+            board = losing_board.LosingBoard(b_fen=EP_FEN)
+            agent = chess_agents.AlphaBetaAgent(counter.evaluate, counter.evaluate, color=chess.WHITE, depth=3,
+                                                parallelize=parallelize, parallel_mode='root')
+            try:
+                values.append(agent.get_move(game.Game(board, agent, None), return_value=True)[1])
+            finally:
+                agent.close()
+        self.assertAlmostEqual(values[0], values[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
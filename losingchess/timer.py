@@ -65,8 +65,8 @@ for depth in [0, 1, 2]:
     print 'DEPTH ', depth
     times = []
     for i in range(10):
-        a1 = chess_agents.AlphaBetaAgent(color=chess.WHITE, eval_func=counter.evaluate, depth=depth, ant_eval_func=counter.evaluate, parallelize=True)
-        a2 = chess_agents.AlphaBetaAgent(color=chess.BLACK, eval_func=counter.evaluate, depth=depth, ant_eval_func=counter.evaluate, parallelize=True)
+        a1 = chess_agents.AlphaBetaAgent(color=chess.WHITE, eval_func=counter.evaluate, depth=depth, ant_eval_func=counter.evaluate, parallelize=True, parallel_mode='root')
+        a2 = chess_agents.AlphaBetaAgent(color=chess.BLACK, eval_func=counter.evaluate, depth=depth, ant_eval_func=counter.evaluate, parallelize=True, parallel_mode='root')
         board = losing_board.LosingBoard(no_kings=False)
 
         game_to_play = game.Game(board, a1, a2)
@@ -82,6 +82,28 @@ for depth in [0, 1, 2]:
 
     print 'A-B WITH PARALLELIZATION ' + str(depth) + ': ' + str(np.mean(times))
 
+print '### A-B WITH YOUNG BROTHERS WAIT ###'
+for depth in [2, 3, 4]:
+    print 'DEPTH ', depth
+    times = []
+    for i in range(10):
+        a1 = chess_agents.AlphaBetaAgent(color=chess.WHITE, eval_func=counter.evaluate, depth=depth, ant_eval_func=counter.evaluate, parallelize=True, parallel_mode='ybwc')
+        a2 = chess_agents.AlphaBetaAgent(color=chess.BLACK, eval_func=counter.evaluate, depth=depth, ant_eval_func=counter.evaluate, parallelize=True, parallel_mode='ybwc')
+        board = losing_board.LosingBoard(no_kings=False)
+
+        game_to_play = game.Game(board, a1, a2)
+
+        start = time.time()
+        game_to_play.play()
+        end = time.time()
+        times.append(end - start)
+        print (end - start)
+
+        if depth >= 3 and i > 3:
+            break
+
+    print 'A-B WITH YOUNG BROTHERS WAIT ' + str(depth) + ': ' + str(np.mean(times))
+
 times = pd.Series([0.446, 40.201, 9150.533, 0.417, 10.635, 432.256, 0.417, 7.518, 109.635], name='Time')
 depths = pd.Series([1,2,3,1,2,3,1,2,3], name='Depth')
 methods = pd.Series(['Minimax', 'Minimax', 'Minimax', 'Alpha-Beta', 'Alpha-Beta', 'Alpha-Beta', 'Alpha-Beta w/ Parallelization', 'Alpha-Beta w/ Parallelization', 'Alpha-Beta w/ Parallelization'], name='Search_Method')
@@ -0,0 +1,215 @@
+import chess
+import numpy as np
+
+import multiprocessing
+
+# bound types of a stored value; 0 marks an empty slot
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+# bytes per entry: key (8), value (8), move (2), depth (1), bound type (1)
+ENTRY_BYTES = 20
+
+# bytes per entry of the shared table: check word, data word and value, 8 bytes each
+SHARED_ENTRY_BYTES = 24
+
+def encode_move(mv):
+    """
+    Pack a move into 16 bits: from square, to square and promotion piece type.
+    """
+    if mv is None:
+        return 0
+    return mv.from_square | (mv.to_square << 6) | ((mv.promotion or 0) << 12)
+
+def decode_move(code):
+    """
+    Inverse of encode_move.
+    """
+    if code == 0:
+        return None
+    return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+
+class TranspositionTable:
+    """
+    Fixed-size transposition table keyed by LosingBoard.zobrist_hash.
+
+    Entries live in parallel numpy arrays rather than a dict, so memory is bounded by
+    size_mb. The table is split into buckets of two slots: the first slot keeps the
+    deepest search seen for the bucket (depth-preferred), and the second is always
+    replaced, so shallow recent results still get stored.
+    """
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.allocate(ENTRY_BYTES)
+
+        self.keys = np.zeros(self.num_entries, dtype=np.uint64)
+        self.values = np.zeros(self.num_entries, dtype=np.float64)
+        self.moves = np.zeros(self.num_entries, dtype=np.uint16)
+        self.depths = np.zeros(self.num_entries, dtype=np.int8)
+        self.flags = np.zeros(self.num_entries, dtype=np.uint8)
+
+        self.reset_stats()
+
+    def allocate(self, entry_bytes):
+        """
+        Set the number of entries, rounding the number of buckets down to a power of two
+        so a mask picks the bucket.
+        """
+        n_buckets = 1
+        while n_buckets * 4 * entry_bytes <= self.size_mb * 2 ** 20:
+            n_buckets *= 2
+        self.mask = n_buckets - 1
+        self.num_entries = 2 * n_buckets
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def clear(self):
+        """
+        Empty the table, keeping its memory.
+        """
+        self.flags.fill(0)
+        self.reset_stats()
+
+    def probe(self, key):
+        """
+        Return (depth, bound type, value, best move) stored for key, or None.
+        """
+        self.probes += 1
+        i = (key & self.mask) << 1
+        for slot in (i, i + 1):
+            if self.flags[slot] and int(self.keys[slot]) == key:
+                self.hits += 1
+                return (int(self.depths[slot]), int(self.flags[slot]),
+                        float(self.values[slot]), decode_move(int(self.moves[slot])))
+
+        # the bucket is holding other positions
+        if self.flags[i] or self.flags[i + 1]:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, flag, value, move=None):
+        """
+        Store the result of a search of the given depth. The depth-preferred slot is
+        taken if it is empty, holds this position, or holds a shallower search;
+        otherwise the always-replace slot is used.
+        """
+        self.stores += 1
+        i = (key & self.mask) << 1
+        if self.flags[i] and int(self.keys[i]) != key and depth < self.depths[i]:
+            i += 1
+        if self.flags[i] and int(self.keys[i]) != key:
+            self.overwrites += 1
+
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.flags[i] = flag
+        self.values[i] = value
+        self.moves[i] = encode_move(move)
+
+    def usage(self):
+        """
+        Fraction of slots in use.
+        """
+        return np.count_nonzero(self.flags) / float(self.num_entries)
+
+    def stats(self):
+        """
+        Return a dict of hit/collision counters and table usage.
+        """
+        return {'size_mb': self.size_mb,
+                'entries': self.num_entries,
+                'usage': self.usage(),
+                'probes': self.probes,
+                'hits': self.hits,
+                'hit_rate': self.hits / float(self.probes) if self.probes else 0.0,
+                'collisions': self.collisions,
+                'stores': self.stores,
+                'overwrites': self.overwrites}
+
+    def __getstate__(self):
+        # only the size is pickled; a copy sent to another process starts out empty
+        return {'size_mb': self.size_mb}
+
+    def __setstate__(self, state):
+        self.__init__(state['size_mb'])
+
+class SharedTranspositionTable(TranspositionTable):
+    """
+    Transposition table in shared memory, for processes forked after it is created.
+
+    There are no locks. An entry is three 64-bit words: a data word packing depth, bound
+    type and move, the value, and a check word equal to key ^ data ^ value bits. A
+    reader only accepts an entry whose words xor back to its key, so an entry torn by
+    two processes writing at once reads as a miss rather than a wrong result.
+
+    (python 2 has no multiprocessing.shared_memory, so the table is a RawArray viewed
+    through numpy.) Hit and collision counts are kept per process.
+    """
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.allocate(SHARED_ENTRY_BYTES)
+
+        self.shared = multiprocessing.RawArray('c', SHARED_ENTRY_BYTES * self.num_entries)
+        self.words = np.frombuffer(self.shared, dtype=np.uint64).reshape(self.num_entries, 3)
+        self.values = self.words[:, 2].view(np.float64)
+
+        self.reset_stats()
+
+    def clear(self):
+        self.words.fill(0)
+        self.reset_stats()
+
+    def probe(self, key):
+        self.probes += 1
+        i = (key & self.mask) << 1
+        occupied = False
+        for slot in (i, i + 1):
+            check, data, value_bits = [int(w) for w in self.words[slot]]
+            if data:
+                occupied = True
+                if check ^ data ^ value_bits == key:
+                    self.hits += 1
+                    # the value comes from the words just checked, not a second read
+                    value = float(np.uint64(value_bits).view(np.float64))
+                    return (self.stored_depth(data), (data >> 8) & 0xff,
+                            value, decode_move(data >> 16))
+
+        if occupied:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, flag, value, move=None):
+        self.stores += 1
+        i = (key & self.mask) << 1
+        data = int(self.words[i, 1])
+        if data and self.stored_key(i) != key and depth < self.stored_depth(data):
+            i += 1
+            data = int(self.words[i, 1])
+        if data and self.stored_key(i) != key:
+            self.overwrites += 1
+
+        data = (depth & 0xff) | (flag << 8) | (encode_move(move) << 16)
+        self.values[i] = value
+        self.words[i, 1] = data
+        self.words[i, 0] = key ^ data ^ int(self.words[i, 2])
+
+    def stored_key(self, slot):
+        check, data, value_bits = [int(w) for w in self.words[slot]]
+        return check ^ data ^ value_bits
+
+    def stored_depth(self, data):
+        depth = data & 0xff
+        return depth - 256 if depth > 127 else depth
+
+    def usage(self):
+        return np.count_nonzero(self.words[:, 1]) / float(self.num_entries)
+
+    def __getstate__(self):
+        # an unpickled copy would be private to its process, no longer shared
+        raise Exception("SharedTranspositionTable is shared by forking, not pickling")
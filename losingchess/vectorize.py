@@ -1,6 +1,8 @@
 import chess
 import losing_board
 
+import numpy as np
+
 # vectorization by board squares, currently unused
 def square_vector(board):
     board_type = board.__class__.__name__
@@ -216,6 +218,97 @@ def piece_vector(board):
 
     return out_vec
 
+# piece_vector read straight from the bitboards into a float32 array, with the same layout:
+# for each piece type, the (file + 1, rank + 1) of up to piece_slots[ptype] pieces of each
+# color, lowest square first, then the number of pieces of each color under attack, the
+# piece counts, the en passant square and the turn
+PIECE_VECTOR_LEN = 80
+piece_slots = {chess.PAWN: 8, chess.KNIGHT: 2, chess.BISHOP: 2, chess.ROOK: 2, chess.QUEEN: 1, chess.KING: 1}
+
+NOT_FILE_A = chess.BB_ALL & ~chess.BB_FILE_A
+NOT_FILE_H = chess.BB_ALL & ~chess.BB_FILE_H
+
+def pop_count(bb):
+    return bin(bb).count('1')
+
+def chess_board(board):
+    """
+    The python-chess Board of board, which may be a LosingBoard or a Board.
+    """
+    if board.__class__.__name__ == 'LosingBoard':
+        return board.board
+    return board
+
+def attacked_mask(board, color):
+    """
+    The squares attacked by the pieces of color on chess.Board board.
+    """
+    pieces = board.occupied_co[color]
+    pawns = board.pawns & pieces
+    if color == chess.WHITE:
+        attacked = ((pawns << 9) & NOT_FILE_A) | ((pawns << 7) & NOT_FILE_H)
+    else:
+        attacked = ((pawns >> 7) & NOT_FILE_A) | ((pawns >> 9) & NOT_FILE_H)
+    attacked &= chess.BB_ALL
+
+    # knights and kings from the attack tables, sliders from the board
+    others = pieces & ~pawns
+    while others:
+        low = others & -others
+        square = low.bit_length() - 1
+        if low & board.knights:
+            attacked |= chess.BB_KNIGHT_ATTACKS[square]
+        elif low & board.kings:
+            attacked |= chess.BB_KING_ATTACKS[square]
+        else:
+            attacked |= board.attacks_mask(square)
+        others ^= low
+    return attacked
+
+def piece_vector_array(board, out=None):
+    """
+    piece_vector of board as a float32 array, written into out if given.
+    """
+    board = chess_board(board)
+    if out is None:
+        out = np.zeros(PIECE_VECTOR_LEN, dtype=np.float32)
+    else:
+        out[:] = 0
+
+    # squares of the pieces given slots, per color
+    placed = [0, 0]
+    i = 0
+    for ptype, bb in [(chess.PAWN, board.pawns), (chess.KNIGHT, board.knights), (chess.BISHOP, board.bishops),
+                      (chess.ROOK, board.rooks), (chess.QUEEN, board.queens), (chess.KING, board.kings)]:
+        slots = piece_slots[ptype]
+        for color in [chess.WHITE, chess.BLACK]:
+            pieces = bb & board.occupied_co[color]
+            out[66 + (0 if color == chess.WHITE else 6) + ptype - 1] = pop_count(pieces)
+            for slot in range(slots):
+                if not pieces:
+                    break
+                low = pieces & -pieces
+                square = low.bit_length() - 1
+                out[i + 2 * slot] = (square & 7) + 1
+                out[i + 2 * slot + 1] = (square >> 3) + 1
+                placed[color] |= low
+                pieces ^= low
+            i += 2 * slots
+
+    out[64] = pop_count(placed[chess.WHITE] & attacked_mask(board, chess.BLACK))
+    out[65] = pop_count(placed[chess.BLACK] & attacked_mask(board, chess.WHITE))
+
+    if board.has_legal_en_passant():
+        out[78] = board.ep_square
+    out[79] = int(board.turn)
+    return out
+
+# equivalents of vectorizations that return float32 arrays faster, used by the evaluators
+array_methods = {piece_vector: piece_vector_array}
+
+def array_method(vectorize_method):
+    return array_methods.get(vectorize_method, vectorize_method)
+
 # simplified vectorization, only working with piece counts
 def piece_count_vector(board):
     piece_types = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]
@@ -234,6 +327,87 @@ def piece_count_vector(board):
     out_vec = white_counts + black_counts
     return out_vec
 
+# one-hot piece placement: a feature for each colored piece type on each square, then the turn.
+# A move changes only a few features, so networks on this vectorization can be evaluated
+# incrementally (see accumulator.py)
+PIECE_SQUARE_TURN = 12 * 64
+
+def piece_square_index(color, ptype, square):
+    return ((0 if color == chess.WHITE else 6) + ptype - 1) * 64 + square
+
+def piece_square_vector(board):
+    board_type = board.__class__.__name__
+    out_vec = [0] * (PIECE_SQUARE_TURN + 1)
+    piece_types = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]
+    for color in [chess.WHITE, chess.BLACK]:
+        for ptype in piece_types:
+            for square in board.pieces(ptype, color):
+                out_vec[piece_square_index(color, ptype, square)] = 1
+
+    # turn
+    if board_type == 'LosingBoard':
+        out_vec[PIECE_SQUARE_TURN] = int(board.turn())
+    else:
+        out_vec[PIECE_SQUARE_TURN] = int(board.turn)
+
+    return out_vec
+
+# batch versions of the vectorizations, which take a sequence of boards (LosingBoards or
+# python-chess Boards) and return one N x F float32 array, a row per board
+SQUARE_VECTOR_LEN = 66
+PIECE_COUNT_VECTOR_LEN = 12
+
+def piece_bitboards(board):
+    return [(chess.PAWN, board.pawns), (chess.KNIGHT, board.knights), (chess.BISHOP, board.bishops),
+            (chess.ROOK, board.rooks), (chess.QUEEN, board.queens), (chess.KING, board.kings)]
+
+def square_vectors(boards):
+    out = np.zeros((len(boards), SQUARE_VECTOR_LEN), dtype=np.float32)
+    for i, board in enumerate(boards):
+        board = chess_board(board)
+        row = [0] * SQUARE_VECTOR_LEN
+        for ptype, bb in piece_bitboards(board):
+            # white pieces are coded 1, 3, ... 11 by type, and black pieces 2, 4, ... 12
+            for color, code in [(chess.WHITE, 2 * ptype - 1), (chess.BLACK, 2 * ptype)]:
+                pieces = bb & board.occupied_co[color]
+                while pieces:
+                    low = pieces & -pieces
+                    row[low.bit_length() - 1] = code
+                    pieces ^= low
+        if board.has_legal_en_passant():
+            row[64] = board.ep_square
+        row[65] = int(board.turn)
+        out[i] = row
+    return out
+
+def piece_vectors(boards):
+    out = np.empty((len(boards), PIECE_VECTOR_LEN), dtype=np.float32)
+    for i, board in enumerate(boards):
+        piece_vector_array(board, out[i])
+    return out
+
+def piece_count_vectors(boards):
+    out = np.empty((len(boards), PIECE_COUNT_VECTOR_LEN), dtype=np.float32)
+    for i, board in enumerate(boards):
+        board = chess_board(board)
+        white, black = board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]
+        out[i] = [pop_count(bb & white) for ptype, bb in piece_bitboards(board)] + \
+                 [pop_count(bb & black) for ptype, bb in piece_bitboards(board)]
+    return out
+
+batch_methods = {square_vector: square_vectors, piece_vector: piece_vectors, piece_count_vector: piece_count_vectors}
+
+def vectorize_batch(vectorize_method, boards):
+    """
+    vectorize_method of each of boards, as one N x F float32 array.
+    """
+    if vectorize_method in batch_methods:
+        return batch_methods[vectorize_method](boards)
+    out = np.empty((len(boards), get_vector_len(vectorize_method)), dtype=np.float32)
+    for i, board in enumerate(boards):
+        out[i] = vectorize_method(board)
+    return out
+
 # get the length of a vectorization output for neural network construction
 def get_vector_len(vectorize_method):
     board = losing_board.LosingBoard()
@@ -0,0 +1,146 @@
+import chess
+import losing_board
+
+import multiprocessing
+import random
+import signal
+
+"""
+Long-lived worker processes for the parallel root search of AlphaBetaAgent.
+
+The agent is handed to the workers once, when the pool is started: workers are forked,
+so they inherit it without pickling. After that, a task only carries the position (as a
+fen), the root move (as uci), the search window and the depth; workers share the
+best root value found so far through a shared double.
+"""
+
+# the agent searching in this worker process, and the last position it was given
+_agent = None
+_board = None
+
+def init_worker_process():
+    """
+    Set up a newly forked pool worker, here or in any other pool of search processes.
+    """
+    # forked workers would otherwise share the parent's random state
+    random.seed()
+    # interrupts are handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _init_worker(agent, shared_alpha, stop_flag):
+    global _agent
+    _agent = agent
+    _agent.shared_alpha = shared_alpha
+    _agent.stop_flag = stop_flag
+    init_worker_process()
+
+def _worker_board(fen):
+    """
+    LosingBoard for fen, reused while consecutive tasks share a root position.
+    """
+    global _board
+    if _board is None or _board.fen() != fen:
+        _board = losing_board.LosingBoard(b_fen=fen)
+    return _board
+
+def _search_task(task):
+    index, fen, uci, alpha, beta, plies = task
+    board = _worker_board(fen)
+    return index, _agent._search_root_move(chess.Move.from_uci(uci), board, alpha, beta, plies)
+
+def _shared_search_task(task):
+    index, fen, uci, plies = task
+    board = _worker_board(fen)
+    value, exact = _agent._shared_search_root_move(chess.Move.from_uci(uci), board, plies)
+    return index, value, exact
+
+def _helper_task(task):
+    helper, fen = task
+    return _agent._helper_search(_worker_board(fen), helper)
+
+class WorkerPool:
+    """
+    A pool of processes, one per core by default, each holding a copy of agent as it
+    was when the pool started. Workers keep their transposition tables and move
+    ordering tables from move to move.
+
+    alpha is a shared double, inherited by the workers, holding the best root value
+    found so far in a search_shared call. stop is a shared flag that ends the helper
+    searches started by start_helpers.
+    """
+    def __init__(self, agent, processes=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.alpha = multiprocessing.Value('d', 0.0)
+        self.stop = multiprocessing.RawValue('b', 0)
+        self.helpers = None
+        self.pool = multiprocessing.Pool(self.processes, _init_worker, (agent, self.alpha, self.stop))
+
+    def search(self, board, moves, alpha, beta, plies):
+        """
+        Search each root move on board (a LosingBoard) within the (alpha, beta) window.
+        Moves are handed out one at a time, largest expected subtree first, so that no
+        worker is left with a long search at the end.
+        Yield (index into moves, value) pairs as they finish.
+        """
+        tasks = [(alpha, beta, plies)] * len(moves)
+        return self.pool.imap_unordered(_search_task, self.make_tasks(board, moves, tasks), chunksize=1)
+
+    def search_shared(self, board, moves, alpha, plies):
+        """
+        Search each root move on board against the shared alpha, which starts at alpha
+        and is raised by the workers as they find better moves.
+        Yield (index into moves, value, exact) triples as they finish; see
+        AlphaBetaAgent._shared_search_root_move.
+        """
+        self.alpha.value = alpha
+        tasks = [(plies,)] * len(moves)
+        return self.pool.imap_unordered(_shared_search_task, self.make_tasks(board, moves, tasks), chunksize=1)
+
+    def start_helpers(self, board):
+        """
+        Start a lazy SMP helper search of board in every worker.
+        """
+        self.stop.value = 0
+        fen = board.fen()
+        tasks = [(helper, fen) for helper in range(1, self.processes + 1)]
+        self.helpers = self.pool.map_async(_helper_task, tasks, chunksize=1)
+
+    def stop_helpers(self):
+        """
+        Stop the helper searches, wait for them, and return the nodes they searched.
+        """
+        self.stop.value = 1
+        nodes = sum(self.helpers.get())
+        self.helpers = None
+        return nodes
+
+    def make_tasks(self, board, moves, args):
+        """
+        Tasks (index, fen, uci) + args for each move, largest expected subtree first.
+        """
+        fen = board.fen()
+        tasks = [(i, fen, mv.uci()) + extra for i, (mv, extra) in enumerate(zip(moves, args))]
+        sizes = [self.subtree_size(board, mv) for mv in moves]
+        tasks.sort(key=lambda task: sizes[task[0]], reverse=True)
+        return tasks
+
+    def subtree_size(self, board, mv):
+        """
+        The opponent's number of replies to mv, as a guess at the size of its subtree.
+        """
+        board.push(mv)
+        try:
+            return len(board.get_legal_moves())
+        finally:
+            board.pop()
+
+    def close(self):
+        """
+        Stop the workers and wait for them to exit.
+        """
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()